@@ -0,0 +1,171 @@
+import numpy as np
+from typing import Dict, Sequence, Tuple, Union
+
+from game_rules.transforms import STEPS, TURNS
+
+
+class FieldAnalysis:
+    """
+    Maps computed from the labels of a field, shared by all snakes.
+
+    Maps are computed lazily, with vectorized wavefront expansion over the whole field, and kept until the analysis
+    is dropped. `Environment.analysis` keeps one analysis per version of its field, so that each map is computed at
+    most once for each state of the field, whichever snake asks for it first. All maps are read-only and laid out as
+    the field, i.e. indexed by [y, x].
+
+    Cells holding food or nothing are passable; heads, bodies, walls and corpses are not. Unreachable or blocked
+    cells have distance -1.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Labels of the field, as in `Environment.game_field`.
+    food : Tuple[int, int]
+        Food position (x, y).
+    heads : Dict[int, Tuple[int, int]]
+        Head position (x, y) of each living snake, by snake number.
+    wrap : bool, optional
+        If True the field wraps around, otherwise it is closed. The default is True.
+
+    """
+
+    def __init__(self, labels: np.ndarray, food: Tuple[int, int], heads: Dict[int, Tuple[int, int]],
+                 wrap: bool = True):
+        super().__init__()
+
+        # Store arguments
+        self._passable = np.asarray(labels) <= 0
+        self._food = food
+        self._heads = dict(heads)
+        self._wrap = wrap
+
+        # Init cached maps
+        self._food_distance: Union[np.ndarray, None] = None
+        self._regions: Union[np.ndarray, None] = None
+        self._region_size: Union[np.ndarray, None] = None
+        self._enemy_head_distance: Dict[int, np.ndarray] = {}
+
+    @property
+    def food_distance(self) -> np.ndarray:
+        # Number of steps from each cell to the food
+        if self._food_distance is None:
+            self._food_distance = self.__distance([self._food])
+        return self._food_distance
+
+    @property
+    def regions(self) -> np.ndarray:
+        # Connected region of each passable cell, as the smallest flat index of its cells, -1 for blocked cells
+        if self._regions is None:
+            self.__find_regions()
+        return self._regions
+
+    @property
+    def region_size(self) -> np.ndarray:
+        # Number of cells of the region holding each cell, 0 for blocked cells
+        if self._region_size is None:
+            self.__find_regions()
+        return self._region_size
+
+    def enemy_head_distance(self, num: int) -> np.ndarray:
+        # Number of steps from each cell to the nearest head of the other snakes
+        if num not in self._enemy_head_distance:
+            self._enemy_head_distance[num] = self.__distance([head for n, head in self._heads.items() if n != num])
+        return self._enemy_head_distance[num]
+
+    def __neighbours(self, values: np.ndarray, fill) -> Tuple[np.ndarray, ...]:
+        # Get values of the cells above, below, left and right of each cell, wrapping around or filling outside
+        padded = np.empty((values.shape[0] + 2, values.shape[1] + 2), dtype=values.dtype)
+        padded[1:-1, 1:-1] = values
+        if self._wrap:
+            padded[0, 1:-1], padded[-1, 1:-1] = values[-1], values[0]
+            padded[1:-1, 0], padded[1:-1, -1] = values[:, -1], values[:, 0]
+        else:
+            padded[0, :] = padded[-1, :] = padded[:, 0] = padded[:, -1] = fill
+        return padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]
+
+    def __distance(self, sources: Sequence[Tuple[int, int]]) -> np.ndarray:
+        # Expand a wavefront from the sources through passable cells
+        distance = np.full(self._passable.shape, -1, dtype='int32')
+        sources = np.asarray(sources, dtype='int64').reshape(-1, 2)
+        front = np.zeros(self._passable.shape, dtype=bool)
+        front[sources[:, 1], sources[:, 0]] = True
+        distance[front] = 0
+        step = 0
+        unvisited = self._passable & ~front
+        while front.any():
+            step += 1
+            up, down, left, right = self.__neighbours(front, False)
+            front = (up | down | left | right) & unvisited
+            unvisited &= ~front
+            distance[front] = step
+        distance.flags.writeable = False
+        return distance
+
+    def __find_regions(self):
+        # Spread the smallest flat index of each region until nothing changes
+        blocked = np.iinfo('int64').max
+        regions = np.where(self._passable, np.arange(self._passable.size).reshape(self._passable.shape), blocked)
+        flat = np.arange(regions.size).reshape(regions.shape)
+        while True:
+            up, down, left, right = self.__neighbours(regions, blocked)
+            spread = np.minimum(np.minimum(up, down), np.minimum(left, right))
+            spread = np.where(self._passable, np.minimum(spread, regions), blocked)
+
+            # Jump to the region of the cell each region is named after, to spread faster along long regions
+            spread = np.where(self._passable, spread.reshape(-1)[np.where(self._passable, spread, flat)], blocked)
+            if (spread == regions).all():
+                break
+            regions = spread
+
+        # Count cells of each region
+        regions = np.where(self._passable, regions, -1)
+        sizes = np.bincount(regions[self._passable], minlength=regions.size)
+        self._region_size = np.where(self._passable, sizes[np.maximum(regions, 0)], 0)
+        self._regions = regions
+        self._regions.flags.writeable = False
+        self._region_size.flags.writeable = False
+
+
+class SnakeAnalysis:
+    """
+    Field analysis as seen by one snake, passed to moving methods flagged with `with_analysis`.
+
+    Parameters
+    ----------
+    analysis : FieldAnalysis
+        Analysis of the field.
+    num : int
+        Number of the snake in the field.
+    head : Tuple[int, int]
+        Head position (x, y).
+    direction : int
+        Direction of the snake, as index in DIRECTIONS.
+
+    """
+
+    def __init__(self, analysis: FieldAnalysis, num: int, head: Tuple[int, int], direction: int):
+        super().__init__()
+
+        # Store arguments
+        self.analysis = analysis
+        self.num = num
+        self.head = head
+        self.direction = direction
+
+    @property
+    def food_distance(self) -> np.ndarray:
+        return self.analysis.food_distance
+
+    @property
+    def region_size(self) -> np.ndarray:
+        return self.analysis.region_size
+
+    @property
+    def enemy_head_distance(self) -> np.ndarray:
+        return self.analysis.enemy_head_distance(self.num)
+
+    def moves(self, values: np.ndarray) -> np.ndarray:
+        # Get values of the cells reached turning left, going straight and turning right
+        height, width = values.shape
+        cells = (np.asarray(self.head) + STEPS[TURNS[self.direction]]) % (width, height)
+        return values[cells[:, 1], cells[:, 0]]
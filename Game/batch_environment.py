@@ -0,0 +1,456 @@
+import numpy as np
+from typing import Union, Sequence, Callable
+
+import game_rules
+from game_rules.transforms import STEPS, TURNS, egocentric
+from Game.free_cells import FreeCells
+from Snake.policy import ObservationBuffer, is_batched
+
+
+class BatchEnvironment:
+    """
+    Run many independent games in lockstep.
+
+    All games share the same rules and number of snakes. Their state (game fields, snake bodies, heads,
+    directions, food and scores) is stored in stacked NumPy arrays, so that a single call to `update` moves every
+    snake of every game. Snakes are processed slot by slot, exactly in the order used by `Environment.update`, while
+    the work for a slot is vectorized over all the games. Fields and their free cells are updated in place, dead
+    snakes included, and body buffers start small and double their capacity when a snake outgrows them, as in
+    `Snake`. The Python loop over slots is a fixed cost per tick, so the time per game drops as more games are run:
+    with 4 snakes on 20x20 fields a game step costs about 3-4 us with 1000 games and about 2 us with 10000.
+
+    Parameters
+    ----------
+    num_envs : int, optional
+        Number of games to simulate. The default is 1.
+    game_mode : str, optional
+        Game mode, see `game_rules.GameModes`. The default is 'field'.
+    width : int, optional
+        Width of the game field. The default is 10.
+    height : int, optional
+        Height of the game field. The default is 10.
+    border : bool, optional
+        If True use borders, otherwise use teleportation. The default is False.
+    seed : int, optional
+        Seed of the random generator used to place food and snakes. The default is None.
+
+    """
+
+    def __init__(self, num_envs: int = 1, game_mode: str = 'field', width: int = 10, height: int = 10,
+                 border: bool = False, seed: int = None):
+        super().__init__()
+
+        # Init attributes
+        self.__game_mode = game_mode
+        self._num_envs = num_envs
+        self._width = width
+        self._height = height
+        self.__border = border
+        self.__snake_num_offset: int = 2
+        self._rng = np.random.default_rng(seed)
+        self.game_properties: dict = {}
+        self.__move_snakes: Sequence[Callable] = ()
+        self.__buffer = ObservationBuffer()
+
+        # Init field matrix
+        self._field = np.zeros((height - self.__border*2, width - self.__border*2), dtype=bool)
+        if self.__border:
+            self._field = np.pad(self._field, ((1, 1), (1, 1)), constant_values=True)
+
+        # Init games state
+        self.__allocate(0)
+
+    def __allocate(self, num_snakes: int):
+        # Allocate the stacked arrays holding the state of every game
+        n, s = self._num_envs, num_snakes
+        self._capacity = 16
+        self._game_fields = np.zeros((n, self._height, self._width), dtype='int8')
+        self._corpses = np.zeros((n, self._height, self._width), dtype=bool)
+        self._food = np.zeros((n, 2), dtype='int64')
+        self._heads = np.zeros((n, s, 2), dtype='int64')
+        self._directions = np.zeros((n, s), dtype='int64')
+        self._lengths = np.zeros((n, s), dtype='int64')
+        self._scores = np.zeros((n, s), dtype='int64')
+        self._alive = np.zeros((n, s), dtype=bool)
+        self._bodies = np.zeros((n, s, self._capacity, 2), dtype='int16')
+        self._body_start = np.zeros((n, s), dtype='int64')
+        self._body_count = np.zeros((n, s), dtype='int64')
+        self._game_fields[:] = self._field
+        self._free = FreeCells(self._game_fields.reshape(n, -1) <= 0)
+
+    @property
+    def num_envs(self):
+        return self._num_envs
+
+    @property
+    def num_snakes(self):
+        return self._alive.shape[1]
+
+    @property
+    def field(self):
+        return self._field
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def game_fields(self):
+        fields = self._game_fields.view()
+        fields.flags.writeable = False
+        return fields
+
+    @property
+    def food(self):
+        return self._food.copy()
+
+    @property
+    def heads(self):
+        return self._heads.copy()
+
+    @property
+    def directions(self):
+        return self._directions.copy()
+
+    @property
+    def alive(self):
+        return self._alive.copy()
+
+    def body(self, env: int, snake: int) -> np.ndarray:
+        # Get the body of a snake from tail to head
+        pos = (self._body_start[env, snake] + np.arange(self._body_count[env, snake])) % self._capacity
+        return self._bodies[env, snake, pos]
+
+    def setup(self, num_snakes: int = 1, len_snakes: Union[Sequence[int], int] = 3,
+              pos_snakes: Union[Sequence[Union[None, tuple]], None] = None, food_score: int = 1, kill_score: int = 5,
+              recognize_enemies: bool = False, keep_corpse: bool = False, move_snakes: Sequence[Callable] = None):
+        # Store batched moving methods, if any
+        if move_snakes is not None:
+            assert all(method is None or is_batched(method) for method in move_snakes), \
+                "Moving methods of a batch environment must be batched."
+            num_snakes = len(move_snakes)
+        self.__move_snakes = tuple(move_snakes) if move_snakes is not None else ()
+
+        # Store game properties
+        self.game_properties = {
+            'food_score': food_score,
+            'kill_score': kill_score,
+            'recognize_enemies': recognize_enemies,
+            'keep_corpse': keep_corpse,
+        }
+
+        # Normalize inputs
+        len_snakes = tuple([len_snakes]*num_snakes if isinstance(len_snakes, int) else len_snakes)
+        pos_snakes = tuple([pos_snakes] * num_snakes if pos_snakes is None else pos_snakes)
+        assert (len(len_snakes) == num_snakes) and (len(pos_snakes) == num_snakes), \
+            f"Invalid number of snakes. Expected: {num_snakes}, got {len(len_snakes)} and {len(pos_snakes)}."
+        self.game_properties.update(len_snakes=len_snakes, pos_snakes=pos_snakes)
+
+        # Allocate games and start them
+        self.__allocate(num_snakes)
+        self.reset()
+
+    def reset(self, envs: Union[Sequence[int], np.ndarray, None] = None):
+        # Select games to restart
+        envs = np.arange(self._num_envs) if envs is None else np.asarray(envs).reshape(-1)
+        envs = np.flatnonzero(envs) if envs.dtype == bool else envs.astype('int64')
+        if envs.size == 0:
+            return
+
+        # Clear games state
+        self._game_fields[envs] = self._field
+        self._free.reset(self._game_fields[envs].reshape(envs.size, -1) <= 0, envs)
+        self._corpses[envs] = False
+        self._alive[envs] = True
+        self._scores[envs] = 0
+        self._body_start[envs] = 0
+        self._body_count[envs] = 0
+        self._lengths[envs] = self.game_properties.get('len_snakes', ())
+        self._directions[envs] = self._rng.integers(0, 4, (envs.size, self.num_snakes))
+
+        # Place snakes with a fixed position first
+        pos_snakes = self.game_properties.get('pos_snakes', ())
+        for num, pos_snake in enumerate(pos_snakes):
+            if pos_snake is not None:
+                self.__spawn(envs, num, np.broadcast_to(np.asarray(pos_snake), (envs.size, 2)))
+
+        # Put food, then place remaining snakes where food was
+        self._food[envs] = -1
+        self.__put_food(envs)
+        for num, pos_snake in enumerate(pos_snakes):
+            if pos_snake is None:
+                self.__spawn(envs, num, self._food[envs].copy())
+                self.__put_food(envs)
+
+    def __spawn(self, envs: np.ndarray, num: int, pos: np.ndarray):
+        # Put a new snake made of one block in each game
+        self._bodies[envs, num, 0] = pos
+        self._body_count[envs, num] = 1
+        self._heads[envs, num] = pos
+        self._game_fields[envs, pos[:, 1], pos[:, 0]] = num + self.__snake_num_offset
+        self._free.remove(pos[:, 1] * self._width + pos[:, 0], envs)
+
+    def __reserve(self, length: int):
+        # Double the capacity of body buffers until bodies of the given length fit, moving each body at its start
+        capacity = self._capacity
+        while capacity < min(length, self._width * self._height + 1):
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        pos = (self._body_start[..., None] + np.arange(self._capacity)) % self._capacity
+        bodies = np.zeros(self._bodies.shape[:2] + (capacity, 2), dtype='int16')
+        bodies[:, :, :self._capacity] = np.take_along_axis(self._bodies, pos[..., None], axis=2)
+        self._bodies, self._capacity = bodies, capacity
+        self._body_start[:] = 0
+
+    def __put_food(self, envs: np.ndarray):
+        # Remove old food from field
+        old = self._food[envs]
+        placed = old[:, 0] >= 0
+        old_cells = self._game_fields[envs[placed], old[placed, 1], old[placed, 0]]
+        self._game_fields[envs[placed], old[placed, 1], old[placed, 0]] = np.where(old_cells == -1, 0, old_cells)
+
+        # Draw one random free cell per game
+        cells = self._free.sample(self._rng.random(envs.size), envs)
+        found = cells >= 0
+
+        # Update food position (keep the old one if the field is full)
+        envs, cells = envs[found], cells[found]
+        self._food[envs, 0] = cells % self._width
+        self._food[envs, 1] = cells // self._width
+        self._game_fields[envs, self._food[envs, 1], self._food[envs, 0]] = -1
+
+    def send_commands(self, commands: Union[np.ndarray, Sequence]):
+        # Update snakes' direction based on commands ("nesw" index for each game and snake, negative to skip)
+        commands = np.broadcast_to(np.asarray(commands, dtype='int64'), self._directions.shape)
+        self._directions = np.where(commands >= 0, commands % 4, self._directions)
+
+    def observe(self, envs: np.ndarray, nums: np.ndarray, buffer: ObservationBuffer = None) -> tuple:
+        """
+        Get stacked arguments of moving methods, as in `Environment.observe`.
+
+        Parameters
+        ----------
+        envs : np.ndarray
+            Game of each snake.
+        nums : np.ndarray
+            Number of each snake in its game.
+        buffer : ObservationBuffer, optional
+            Buffer where to stack observations.
+
+        Returns
+        -------
+        observations : tuple
+            Stacked relative food positions, bodies (padded repeating the tail) and fields.
+
+        """
+        assert self.__game_mode == game_rules.GameModes.field, \
+            f"Game mode {self.__game_mode} not supported by batch environments."
+        buffer = buffer if buffer is not None else self.__buffer
+        envs, nums = np.asarray(envs, dtype='int64'), np.asarray(nums, dtype='int64')
+        heads, directions = self._heads[envs, nums], self._directions[envs, nums]
+
+        # Get relative food position
+        food = buffer.get('food', (envs.size, 2), 'int32')
+        food[:] = egocentric(self._food[envs], heads, directions)
+        if not self.__border:
+            half = np.array([self._width // 2, self._height // 2])
+            food[:] = np.where(np.abs(food) <= half, food, half - food)
+
+        # Get relative bodies, padded with their tail
+        count = self._body_count[envs, nums]
+        length = int(count.max()) if envs.size else 0
+        offsets = np.maximum(np.arange(length) - (length - count)[:, None], 0)
+        pos = (self._body_start[envs, nums][:, None] + offsets) % self._capacity
+        body = buffer.get('body', (envs.size, length, 2), 'int32')
+        body[:] = egocentric(self._bodies[envs[:, None], nums[:, None], pos], heads, directions)
+
+        # Get fields
+        clip = self.__snake_num_offset if self.game_properties.get('recognize_enemies', False) else None
+        field = buffer.get('field', (envs.size, self._height, self._width), 'int8')
+        np.clip(self._game_fields[envs], 0, clip, out=field)
+
+        return food, body, field
+
+    def __policy_moves(self) -> np.ndarray:
+        # Group living snakes by moving method
+        moves = np.zeros(self._directions.shape, dtype='int64')
+        groups = {}
+        for num, method in enumerate(self.__move_snakes):
+            if method is not None:
+                groups.setdefault(id(method), [method]).append(num)
+
+        # Call each method once with stacked observations
+        for method, *nums in groups.values():
+            envs, slots = np.nonzero(self._alive[:, nums])
+            if envs.size == 0:
+                continue
+            nums = np.asarray(nums)[slots]
+            moves[envs, nums] = np.asarray(method(*self.observe(envs, nums))).reshape(-1)
+
+        return moves
+
+    def update(self, moves: Union[np.ndarray, Sequence, int, None] = None):
+        # Normalize moves, one for each game and snake (-1 turn left, 0 go straight, 1 turn right)
+        if moves is None:
+            moves = self.__policy_moves() if self.__move_snakes else 0
+        moves = np.clip(np.broadcast_to(np.asarray(moves).astype('int64'), self._directions.shape), -1, 1)
+
+        # Store collisions and food eaten
+        offset = self.__snake_num_offset
+        kills = np.zeros((self._num_envs, self.num_snakes + offset), dtype='int64')
+        eat = np.zeros(self._num_envs, dtype=bool)
+        rows = np.arange(self._num_envs)
+
+        # Move snakes, one slot at a time for all games, indexing cells of the fields by flat ids
+        size = self._width * self._height
+        fields = self._game_fields.reshape(-1)
+        food_cells = self._food[:, 1] * self._width + self._food[:, 0]
+        for num in range(self.num_snakes):
+            envs = rows[self._alive[:, num]]
+            if envs.size == 0:
+                continue
+            directions, heads, lengths = self._directions[:, num], self._heads[:, num], self._lengths[:, num]
+            body_start, body_count = self._body_start[:, num], self._body_count[:, num]
+
+            # Update head
+            direction = TURNS[directions[envs], moves[envs, num] + 1]
+            directions[envs] = direction
+            old_head = heads[envs]
+            head_x = (old_head[:, 0] + STEPS[direction, 0]) % self._width
+            head_y = (old_head[:, 1] + STEPS[direction, 1]) % self._height
+            cells = head_y * self._width + head_x
+
+            # Check for food eat
+            ate = cells == food_cells[envs]
+            if ate.any():
+                lengths[envs[ate]] += 1
+                self._scores[envs[ate], num] += self.game_properties.get('food_score', 1)
+                eat[envs[ate]] = True
+
+            # Check for collision
+            collision = fields[envs * size + cells].astype('int64')
+            dead = collision > 0
+            any_dead = bool(dead.any())
+            if any_dead:
+                self._alive[envs[dead], num] = False
+                np.add.at(kills, (envs[dead], collision[dead]), 1)
+
+                # Kill snakes due to head-to-head collision
+                other = collision - offset
+                h2h = dead & (other >= 0) & (other < self.num_snakes)
+                h2h[h2h] = (self._heads[envs[h2h], other[h2h]] == old_head[h2h]).all(-1)
+                self._alive[envs[h2h], other[h2h]] = False
+
+            # Perform movement, growing body buffers if needed
+            count = body_count[envs]
+            if count.max() >= self._capacity:
+                self.__reserve(int(count.max()) + 1)
+            bodies = self._bodies.reshape(-1, 2)
+            first = (envs * self.num_snakes + num) * self._capacity
+            start = body_start[envs]
+            head = np.stack((head_x, head_y), axis=-1)
+            tail = bodies[first + start].astype('int64')
+            bodies[first + (start + count) % self._capacity] = head
+            drop = count + 1 > lengths[envs]
+            body_count[envs] = count + 1 - drop
+            body_start[envs] = (start + drop) % self._capacity
+            heads[envs] = head
+
+            # Update fields of games where the snake survived
+            moved = ~dead
+            self.__clear_cells(envs[moved & drop], tail[moved & drop])
+            fields[envs[moved] * size + cells[moved]] = num + offset
+            self._free.remove(cells[moved], envs[moved])
+
+            # Remove snakes that died from the fields
+            if any_dead:
+                self.__remove_snakes(np.concatenate([envs[dead], envs[h2h]]),
+                                     np.concatenate([np.full(int(dead.sum()), num), other[h2h]]),
+                                     envs[dead & drop], tail[dead & drop], num)
+
+        # Give points for collisions
+        self._scores += self.game_properties.get('kill_score', 5) * kills[:, offset:] * self._alive
+
+        # Update food position
+        if eat.any():
+            self.__put_food(rows[eat])
+
+    def __clear_cells(self, envs: np.ndarray, cells: np.ndarray, unique: bool = True):
+        # Restore the background of some cells (walls, corpses or food), with games given at most once if unique
+        x, y = cells[:, 0], cells[:, 1]
+        background = (self._field[y, x] | self._corpses[envs, y, x]).astype('int8')
+        is_food = (self._food[envs, 0] == x) & (self._food[envs, 1] == y)
+        self._game_fields[envs, y, x] = np.where(is_food & (background == 0), -1, background)
+        free = background == 0
+        (self._free.add if unique else self._free.add_many)(y[free] * self._width + x[free], envs[free])
+
+    def __remove_snakes(self, envs: np.ndarray, nums: np.ndarray, tail_envs: np.ndarray, tails: np.ndarray,
+                        tail_num: int):
+        """
+        Clear the cells of snakes that just died, or turn them into corpses.
+
+        Only cells still labelled with a dead snake are changed, so that the field of each game is updated in place
+        instead of drawn again.
+
+        Parameters
+        ----------
+        envs : np.ndarray
+            Game of each dead snake.
+        nums : np.ndarray
+            Number of each dead snake in its game.
+        tail_envs : np.ndarray
+            Games where the snake of slot `tail_num` died after leaving its tail.
+        tails : np.ndarray
+            Tails left, as (x, y) rows, cleared even when corpses are kept.
+        tail_num : int
+            Slot of the snake that left the tails.
+
+        """
+        # Get body cells of dead snakes, as (game, cell) pairs
+        offset = self.__snake_num_offset
+        games, cells, labels = [], [], []
+        for num in np.unique(nums).tolist():
+            body_games, body_cells = self.__body_cells(envs[nums == num], num)
+            games.append(body_games)
+            cells.append(body_cells)
+            labels.append(np.full(body_games.size, num + offset))
+        games, cells, labels = np.concatenate(games), np.concatenate(cells), np.concatenate(labels)
+
+        # Keep the whole bodies as corpses, or clear them
+        if self.game_properties.get('keep_corpse', False):
+            self._corpses[games, cells[:, 1], cells[:, 0]] = True
+            mine = self._game_fields[games, cells[:, 1], cells[:, 0]] == labels
+            self._game_fields[games[mine], cells[mine, 1], cells[mine, 0]] = 1
+            games, cells, labels = tail_envs, tails, np.full(tail_envs.size, tail_num + offset)
+        else:
+            games = np.concatenate([games, tail_envs])
+            cells = np.concatenate([cells, tails])
+            labels = np.concatenate([labels, np.full(tail_envs.size, tail_num + offset)])
+
+        # Clear each cell still labelled with a dead snake once
+        mine = self._game_fields[games, cells[:, 1], cells[:, 0]] == labels
+        flat = np.unique((games[mine] * self._height + cells[mine, 1]) * self._width + cells[mine, 0])
+        games, flat = np.divmod(flat, self._width * self._height)
+        self.__clear_cells(games, np.stack((flat % self._width, flat // self._width), axis=-1), unique=False)
+
+    def __body_cells(self, envs: np.ndarray, num: int):
+        # Get all body cells of a snake in some games, as (game, cell) pairs
+        count = self._body_count[envs, num]
+        if envs.size == 0 or count.max() == 0:
+            return envs[:0], np.zeros((0, 2), dtype='int64')
+        offsets = np.arange(count.max())
+        valid = offsets < count[:, None]
+        pos = (self._body_start[envs, num][:, None] + offsets) % self._capacity
+        games = np.broadcast_to(envs[:, None], pos.shape)[valid]
+        return games, self._bodies[games, num, pos[valid]].astype('int64')
+
+    def game_over(self) -> np.ndarray:
+        return ~self._alive.any(axis=1)
+
+    def get_scores(self) -> np.ndarray:
+        return self._scores.copy()
@@ -0,0 +1,373 @@
+import numpy as np
+from typing import Dict, Iterable, List, Tuple, Union
+
+
+class BorderField:
+    """
+    Read-only wall matrix of a field whose only walls are its outer cells, computed on access.
+
+    It stands for the boolean matrix `Environment.field` when the field is stored in chunks: indexing it with any
+    NumPy key only computes the selected cells, and `np.asarray` builds the full matrix.
+
+    Parameters
+    ----------
+    shape : Tuple[int, int]
+        Height and width of the field.
+    border : bool, optional
+        If True the outer cells of the field are walls. The default is False.
+
+    """
+
+    dtype = np.dtype(bool)
+    ndim = 2
+
+    def __init__(self, shape: Tuple[int, int], border: bool = False):
+        super().__init__()
+
+        self.shape = tuple(shape)
+        self.border = border
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key) -> Union[np.ndarray, bool]:
+        # Select coordinates of cells from broadcast views of row and column indices, then find walls among them
+        height, width = self.shape
+        ys = np.broadcast_to(np.arange(height)[:, None], self.shape)[key]
+        xs = np.broadcast_to(np.arange(width)[None, :], self.shape)[key]
+        walls = (ys == 0) | (ys == height - 1) | (xs == 0) | (xs == width - 1)
+        return walls & self.border
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self[:, :].astype(dtype or bool)
+
+
+class ChunkedGrid:
+    """
+    Labelled game field stored in square chunks, allocated only where something is.
+
+    It has the same interface and labels as `Grid`, for arenas too large to be stored densely. Each chunk holds the
+    labels and the background (walls and corpses) of its cells, and a chunk is dropped as soon as all its cells are
+    empty again. Counts of free and non-empty cells are kept for every chunk, so food is placed reading one chunk at
+    most, and windows seen by snakes only read the chunks they overlap.
+
+    Full matrices (`labels`, `observation` and `padded_observation`) are built on request, with a cost proportional to
+    the field size.
+
+    Parameters
+    ----------
+    shape : Tuple[int, int]
+        Height and width of the field.
+    clip : int, optional
+        Maximum label visible to move methods, or None to show snake numbers. The default is None.
+    halo : int, optional
+        Size of the halo of `padded_observation`. The default is 0.
+    wrap : bool, optional
+        If True the field wraps around, otherwise cells out of it are walls. The default is True.
+    dtype : str, optional
+        Type of the labels, large enough for all snake numbers. The default is 'int8'.
+    border : bool, optional
+        If True the outer cells of the field are walls. The default is False.
+    chunk_size : int, optional
+        Size of the side of each chunk. The default is 64.
+
+    """
+
+    def __init__(self, shape: Tuple[int, int], clip: Union[int, None] = None, halo: int = 0, wrap: bool = True,
+                 dtype: str = 'int8', border: bool = False, chunk_size: int = 64):
+        super().__init__()
+
+        # Init attributes
+        self._height, self._width = shape
+        self._clip = clip
+        self._halo = halo
+        self._wrap = wrap
+        self._dtype = np.dtype(dtype)
+        self._size = chunk_size
+        self._food: Union[Tuple[int, int], None] = None
+        self._version = 0
+
+        # Init chunks, by (chunk row, chunk column)
+        self._labels: Dict[Tuple[int, int], np.ndarray] = {}
+        self._background: Dict[Tuple[int, int], np.ndarray] = {}
+
+        # Init number of cells, free cells and non-empty cells of each chunk
+        rows = np.minimum(self._height - np.arange(0, self._height, chunk_size), chunk_size)
+        cols = np.minimum(self._width - np.arange(0, self._width, chunk_size), chunk_size)
+        self._cells = np.outer(rows, cols).astype('int64')
+        self._free = self._cells.copy()
+        self._used = np.zeros_like(self._cells)
+
+        # Draw walls around the field
+        if border:
+            xs = np.arange(self._width)
+            ys = np.arange(self._height)
+            walls = np.concatenate([
+                np.stack([xs, np.zeros_like(xs)], 1), np.stack([xs, np.full_like(xs, self._height - 1)], 1),
+                np.stack([np.zeros_like(ys), ys], 1), np.stack([np.full_like(ys, self._width - 1), ys], 1),
+            ])
+            self.__paint(walls, 1, background=True)
+            self.__count(self._labels.keys())
+
+    @property
+    def labels(self) -> np.ndarray:
+        # Build the full matrix of labels
+        labels = np.zeros((self._height, self._width), dtype=self._dtype)
+        for (cy, cx), chunk in self._labels.items():
+            block = labels[cy * self._size:(cy + 1) * self._size, cx * self._size:(cx + 1) * self._size]
+            block[:] = chunk[:block.shape[0], :block.shape[1]]
+        labels.flags.writeable = False
+        return labels
+
+    @property
+    def observation(self) -> np.ndarray:
+        observation = np.clip(self.labels, 0, self._clip)
+        observation.flags.writeable = False
+        return observation
+
+    @property
+    def padded_observation(self) -> np.ndarray:
+        return self.window(self._width // 2, self._height // 2, self._height // 2 + self._halo,
+                           self._width // 2 + self._halo)[:self._height + 2*self._halo, :self._width + 2*self._halo]
+
+    @property
+    def halo(self) -> int:
+        return self._halo
+
+    @property
+    def version(self) -> int:
+        # Number of changes of labels so far, to know when values computed from them are outdated
+        return self._version
+
+    @property
+    def num_free(self) -> int:
+        return int(self._free.sum())
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self._labels)
+
+    @property
+    def food(self) -> Union[Tuple[int, int], None]:
+        return self._food
+
+    @food.setter
+    def food(self, food: Union[Tuple[int, int], None]):
+        # Set the food position, without drawing it
+        self._food = food
+
+    @property
+    def arrays(self) -> tuple:
+        # Get the arrays holding the state of the grid: number of chunks, chunk positions, backgrounds and labels
+        keys = list(self._labels.keys())
+        shape = (len(keys), self._size, self._size)
+        return (
+            np.array([len(keys)], dtype='int32'),
+            np.array(keys, dtype='int32').reshape(-1, 2),
+            np.array([self._background[key] for key in keys], dtype=self._dtype).reshape(shape),
+            np.array([self._labels[key] for key in keys], dtype=self._dtype).reshape(shape),
+        )
+
+    def load(self, buffer: np.ndarray, offset: int = 0) -> int:
+        # Rebuild chunks from a buffer of bytes, as packed after `arrays`, returning the end offset
+        num = int(buffer[offset:offset + 4].view('int32')[0])
+        offset += 4
+        keys = buffer[offset:offset + 8 * num].view('int32').reshape(-1, 2).tolist()
+        offset += 8 * num
+        size = num * self._size * self._size * self._dtype.itemsize
+        shape = (num, self._size, self._size)
+        background = buffer[offset:offset + size].view(self._dtype).reshape(shape)
+        labels = buffer[offset + size:offset + 2 * size].view(self._dtype).reshape(shape)
+        self._background = {tuple(key): chunk.copy() for key, chunk in zip(keys, background)}
+        self._labels = {tuple(key): chunk.copy() for key, chunk in zip(keys, labels)}
+
+        # Count free cells again
+        self._free[:] = self._cells
+        self._used[:] = 0
+        self.__count(self._labels.keys())
+        self._version += 1
+        return offset + 2 * size
+
+    def __chunk(self, x: int, y: int, create: bool = False) -> Tuple[Union[np.ndarray, None], Tuple[int, int]]:
+        # Get the chunk of labels holding a cell, allocating it if required
+        key = (y // self._size, x // self._size)
+        chunk = self._labels.get(key, None)
+        if chunk is None and create:
+            chunk = self._labels[key] = np.zeros((self._size, self._size), dtype=self._dtype)
+            self._background[key] = np.zeros((self._size, self._size), dtype=self._dtype)
+        return chunk, key
+
+    def __cells_shape(self, cy: int, cx: int) -> Tuple[int, int]:
+        # Get the number of rows and columns of a chunk within the field
+        return min(self._size, self._height - cy * self._size), min(self._size, self._width - cx * self._size)
+
+    def __count(self, keys: Iterable[Tuple[int, int]]):
+        # Count free and non-empty cells of some chunks, dropping empty ones
+        for key in list(keys):
+            rows, cols = self.__cells_shape(*key)
+            chunk = self._labels[key][:rows, :cols]
+            self._free[key] = np.count_nonzero(chunk <= 0)
+            self._used[key] = np.count_nonzero(chunk)
+            if self._used[key] == 0:
+                del self._labels[key], self._background[key]
+
+    def __paint(self, cells: np.ndarray, label: int, background: bool = False) -> List[Tuple[int, int]]:
+        # Set the label of many cells at once, chunk by chunk, without counting free cells
+        cells = np.asarray(cells, dtype='int64').reshape(-1, 2)
+        keys = cells[:, ::-1] // self._size
+        touched = []
+        for key in np.unique(keys, axis=0).tolist():
+            key = tuple(key)
+            chunk, _ = self.__chunk(key[1] * self._size, key[0] * self._size, create=True)
+            local = cells[(keys == key).all(axis=1)] % self._size
+            chunk[local[:, 1], local[:, 0]] = label
+            if background:
+                self._background[key][local[:, 1], local[:, 0]] = label
+            touched.append(key)
+        return touched
+
+    def get(self, x: int, y: int) -> int:
+        chunk, _ = self.__chunk(x, y)
+        return 0 if chunk is None else int(chunk[y % self._size, x % self._size])
+
+    def get_cells(self, cells: np.ndarray) -> np.ndarray:
+        # Get labels of many cells, given as (x, y) rows
+        return np.array([self.get(x, y) for x, y in np.asarray(cells).reshape(-1, 2).tolist()], dtype=self._dtype)
+
+    def set(self, x: int, y: int, label: int):
+        # Update label of a cell, allocating its chunk if needed
+        chunk, key = self.__chunk(x, y, create=label != 0)
+        if chunk is None:
+            return
+        old = int(chunk[y % self._size, x % self._size])
+        chunk[y % self._size, x % self._size] = label
+        self._version += 1
+
+        # Update counts, dropping the chunk when empty
+        self._free[key] += int(label <= 0) - int(old <= 0)
+        self._used[key] += int(label != 0) - int(old != 0)
+        if self._used[key] == 0:
+            del self._labels[key], self._background[key]
+
+    def clear(self, x: int, y: int):
+        # Restore background (or food) of a cell
+        chunk, key = self.__chunk(x, y)
+        label = 0 if chunk is None else int(self._background[key][y % self._size, x % self._size])
+        self.set(x, y, -1 if label == 0 and (x, y) == self._food else label)
+
+    def add_wall(self, x: int, y: int):
+        # Add a wall (e.g. a corpse) to the background of a cell, without drawing it
+        self.__chunk(x, y, create=True)
+        key = (y // self._size, x // self._size)
+        self._background[key][y % self._size, x % self._size] = 1
+
+    def __segments(self, start: int, length: int, size: int) -> List[Tuple[int, int, int]]:
+        # Split a range of coordinates into pieces within one chunk, as (output start, coordinate, length)
+        segments = []
+        done = 0
+        while done < length:
+            coord = start + done
+            if not 0 <= coord < size:
+                if self._wrap:
+                    coord %= size
+                else:
+                    # Out of the field, up to its edge
+                    out = (-coord if coord < 0 else length - done)
+                    segments.append((done, -1, min(out, length - done)))
+                    done += segments[-1][2]
+                    continue
+            piece = min(length - done, self._size - coord % self._size, size - coord)
+            segments.append((done, coord, piece))
+            done += piece
+        return segments
+
+    def window(self, x: int, y: int, half_height: int, half_width: int) -> np.ndarray:
+        # Get clipped labels around a cell, reading only the chunks overlapping the window
+        height, width = 2 * half_height + 1, 2 * half_width + 1
+        window = np.zeros((height, width), dtype=self._dtype)
+        for row, yy, rows in self.__segments(y - half_height, height, self._height):
+            for col, xx, cols in self.__segments(x - half_width, width, self._width):
+                block = window[row:row + rows, col:col + cols]
+                if yy < 0 or xx < 0:
+                    block[:] = 1
+                    continue
+                chunk, _ = self.__chunk(xx, yy)
+                if chunk is not None:
+                    ly, lx = yy % self._size, xx % self._size
+                    block[:] = chunk[ly:ly + rows, lx:lx + cols]
+        np.clip(window, 0, self._clip, out=window)
+        return window
+
+    def windows(self, cells: np.ndarray, half_size: int) -> np.ndarray:
+        # Get clipped labels around many cells at once
+        cells = np.asarray(cells).reshape(-1, 2).tolist()
+        windows = np.zeros((len(cells), 2 * half_size + 1, 2 * half_size + 1), dtype=self._dtype)
+        for ii, (x, y) in enumerate(cells):
+            windows[ii] = self.window(x, y, half_size, half_size)
+        return windows
+
+    def sample_free(self, u: float) -> Union[Tuple[int, int], None]:
+        # Pick the chunk holding the free cell of given rank
+        total = int(self._free.sum())
+        if total == 0:
+            return None
+        rank = min(int(u * total), total - 1)
+        counts = np.cumsum(self._free.reshape(-1))
+        index = int(np.searchsorted(counts, rank, side='right'))
+        rank -= int(counts[index] - self._free.reshape(-1)[index])
+        cy, cx = divmod(index, self._free.shape[1])
+
+        # Pick the free cell within the chunk
+        rows, cols = self.__cells_shape(cy, cx)
+        chunk = self._labels.get((cy, cx), None)
+        if chunk is not None:
+            rank = int(np.flatnonzero(chunk[:rows, :cols] <= 0)[rank])
+        yy, xx = divmod(rank, cols)
+        return cx * self._size + xx, cy * self._size + yy
+
+    def move_food(self, x: int, y: int):
+        # Remove old food, unless something else is on top of it
+        old, self._food = self._food, (x, y)
+        if old is not None and self.get(*old) == -1:
+            self.clear(*old)
+
+        # Put new food
+        if self.get(x, y) == 0:
+            self.set(x, y, -1)
+
+    def redraw(self, snakes: Iterable[Tuple[int, np.ndarray]], corpses: Iterable[np.ndarray] = ()):
+        """
+        Draw the whole field from scratch.
+
+        Parameters
+        ----------
+        snakes : Iterable[Tuple[int, np.ndarray]]
+            Label and body (as (x, y) rows) of each snake to draw, in drawing order.
+        corpses : Iterable[np.ndarray]
+            Bodies to add to the background.
+
+        """
+        # Add corpses to background
+        for body in corpses:
+            for x, y in np.asarray(body).reshape(-1, 2).tolist():
+                self.add_wall(x, y)
+
+        # Draw background and food
+        for key, chunk in self._labels.items():
+            chunk[:] = self._background[key]
+        if self._food is not None and self.get(*self._food) == 0:
+            self.__paint(np.array([self._food]), -1)
+
+        # Draw snakes
+        for label, body in snakes:
+            self.__paint(body, label)
+
+        # Count free cells again
+        self._free[:] = self._cells
+        self._used[:] = 0
+        self.__count(self._labels.keys())
+        self._version += 1
@@ -0,0 +1,121 @@
+import numpy as np
+from typing import Sequence, Tuple
+
+# Channels of an encoded observation, in order
+CHANNELS = ('occupied', 'own', 'enemies', 'food')
+
+
+class ObservationCodec:
+    """
+    Bit-packed encoding of fields, to move observations between processes or to disk.
+
+    Each field is split in boolean channels: cells occupied by anything (walls, corpses and snakes), cells of the
+    observing snake, cells of the other snakes, and food. Each channel is packed with `np.packbits` to one bit per
+    cell, so a field costs `width * height / 8` bytes per channel. Decoding unpacks all channels at once, and returns
+    boolean views of the unpacked bits.
+
+    Encoded observations can be stacked along any leading axes, e.g. one per snake or per environment, and decoded
+    all at once.
+
+    Parameters
+    ----------
+    shape : Tuple[int, int]
+        Shape of the fields (height, width).
+    channels : Sequence[str], optional
+        Channels to encode, among CHANNELS. The default is all of them.
+
+    """
+
+    def __init__(self, shape: Tuple[int, int], channels: Sequence[str] = CHANNELS):
+        super().__init__()
+
+        # Store arguments
+        assert all(channel in CHANNELS for channel in channels), f"Channels must be among {CHANNELS}."
+        self.shape = tuple(shape)
+        self.channels = tuple(channels)
+
+        # Init scratch buffer of unpacked channels
+        self._size = int(np.prod(self.shape))
+        self._bits = np.zeros((len(self.channels), self._size), dtype=bool)
+
+    @property
+    def channel_bytes(self) -> int:
+        # Bytes of one packed channel
+        return (self._size + 7) // 8
+
+    @property
+    def nbytes(self) -> int:
+        # Bytes of one encoded observation
+        return len(self.channels) * self.channel_bytes
+
+    def encode(self, labels: np.ndarray, num: int, out: np.ndarray = None) -> np.ndarray:
+        """
+        Encode the field as seen by a snake.
+
+        Parameters
+        ----------
+        labels : np.ndarray
+            Labels of the field, as in `Environment.game_field`.
+        num : int
+            Number of the observing snake in the field.
+        out : np.ndarray, optional
+            Array of shape (channels, channel_bytes) and type uint8 where to write, e.g. a slice of a shared or
+            memory-mapped array. The default is a new array.
+
+        Returns
+        -------
+        packed : np.ndarray
+            Encoded observation, of shape (channels, channel_bytes) and type uint8.
+
+        """
+        # Split labels in channels
+        labels = np.asarray(labels).reshape(-1)
+        for bits, channel in zip(self._bits, self.channels):
+            if channel == 'occupied':
+                np.greater(labels, 0, out=bits)
+            elif channel == 'own':
+                np.equal(labels, num, out=bits)
+            elif channel == 'enemies':
+                np.greater(labels, 1, out=bits)
+                bits &= labels != num
+            else:
+                np.equal(labels, -1, out=bits)
+
+        # Pack bits
+        packed = np.packbits(self._bits, axis=-1)
+        if out is None:
+            return packed
+        out[...] = packed
+        return out
+
+    def encode_many(self, labels: np.ndarray, nums: Sequence[int], out: np.ndarray = None) -> np.ndarray:
+        # Encode the field as seen by many snakes, stacked along the first axis
+        if out is None:
+            out = np.empty((len(nums), len(self.channels), self.channel_bytes), dtype='uint8')
+        for ii, num in enumerate(nums):
+            self.encode(labels, num, out=out[ii])
+        return out
+
+    def decode(self, packed: np.ndarray) -> np.ndarray:
+        """
+        Decode encoded observations.
+
+        Parameters
+        ----------
+        packed : np.ndarray
+            Encoded observations, of shape (..., channels, channel_bytes).
+
+        Returns
+        -------
+        fields : np.ndarray
+            Boolean fields, of shape (..., channels, height, width).
+
+        """
+        packed = np.asarray(packed, dtype='uint8')
+        bits = np.unpackbits(packed, axis=-1, count=self._size)
+        return bits.view(bool).reshape(packed.shape[:-1] + self.shape)
+
+    def channel(self, fields: np.ndarray, name: str) -> np.ndarray:
+        # Get a view of one channel of decoded fields
+        return fields[..., self.channels.index(name), :, :]
+
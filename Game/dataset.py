@@ -0,0 +1,257 @@
+import json
+import numpy as np
+import os
+import queue
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+from Game.environment import Environment
+
+# Columns of a transition, with their type
+COLUMNS = (('observations', 'uint8'), ('actions', 'int8'), ('rewards', 'int32'), ('done', 'bool'))
+INDEX = 'index.json'
+
+
+class TransitionWriter:
+    """
+    Stream (observation, action, reward, done) transitions to disk.
+
+    Transitions are stored in a directory, column by column, in chunks of preallocated memory-mapped `.npy` files
+    holding `chunk_size` rows each. An index lists the shape and type of each column and the rows written in each
+    chunk, and is updated each time a chunk is completed, so that completed chunks can be read while writing.
+
+    Rows are written by a background thread: `write` only copies the given rows and queues them, so the simulation
+    loop can go on right away. Observations are usually bit-packed by `Environment.codec`.
+
+    Parameters
+    ----------
+    path : str
+        Directory to write, created if needed.
+    observation_shape : Tuple[int, ...]
+        Shape of one observation, e.g. `(len(codec.channels), codec.channel_bytes)`.
+    chunk_size : int, optional
+        Rows in each chunk. The default is 65536.
+    max_queued : int, optional
+        Maximum number of writes waiting for the background thread, before `write` blocks. The default is 64.
+
+    """
+
+    def __init__(self, path: str, observation_shape: Tuple[int, ...], chunk_size: int = 65536,
+                 max_queued: int = 64):
+        super().__init__()
+
+        # Store arguments
+        self.path = path
+        self.chunk_size = chunk_size
+        self._shapes = {name: tuple(observation_shape) if name == 'observations' else () for name, _ in COLUMNS}
+        os.makedirs(path, exist_ok=True)
+
+        # Init chunks
+        self._chunks: List[int] = []
+        self._columns: Dict[str, np.memmap] = {}
+        self._rows = 0
+        self._error: Union[BaseException, None] = None
+
+        # Start writing thread
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self.__run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'TransitionWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, observations: np.ndarray, actions: np.ndarray, rewards: np.ndarray, done: np.ndarray):
+        """
+        Queue some transitions to be written.
+
+        Parameters
+        ----------
+        observations : np.ndarray
+            Observations before the step, with shape (rows,) + observation_shape.
+        actions : np.ndarray
+            Moves made in the step, with shape (rows,).
+        rewards : np.ndarray
+            Rewards of the step, with shape (rows,).
+        done : np.ndarray
+            Flags of transitions ending a game, with shape (rows,).
+
+        """
+        if self._error is not None:
+            raise RuntimeError("Transition writer failed.") from self._error
+        rows = tuple(np.array(values, dtype=dtype).reshape((-1,) + self._shapes[name])
+                     for values, (name, dtype) in zip((observations, actions, rewards, done), COLUMNS))
+        assert all(len(values) == len(rows[0]) for values in rows), "All columns must have the same rows."
+        self._queue.put(rows)
+
+    def write_step(self, environment: Environment, observations: np.ndarray, directions: Sequence[int],
+                   scores: Sequence[int], alive: Sequence[bool]):
+        """
+        Queue the transitions of the snakes alive before the last step of an environment.
+
+        Parameters
+        ----------
+        environment : Environment
+            Environment after the step.
+        observations : np.ndarray
+            Encoded observation of each snake before the step, see `Environment.encode_observation`.
+        directions, scores, alive : Sequence
+            Directions, scores and alive flags of the snakes before the step.
+
+        """
+        alive = np.asarray(alive, dtype=bool)
+        turns = (np.asarray(environment.get_directions()) - np.asarray(directions) + 1) % 4 - 1
+        rewards = np.asarray(environment.get_scores()) - np.asarray(scores)
+        done = ~np.asarray(environment.get_alive(), dtype=bool) | environment.game_over()
+        self.write(np.asarray(observations)[alive], turns[alive], rewards[alive], done[alive])
+
+    def __run(self):
+        # Copy queued rows to chunks, until closed
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                break
+            try:
+                self.__store(rows)
+            except BaseException as error:
+                self._error = error
+
+    def __store(self, rows: tuple):
+        # Copy rows, filling chunks one after the other
+        start, count = 0, len(rows[0])
+        while start < count:
+            if not self._columns or self._chunks[-1] == self.chunk_size:
+                self.__new_chunk()
+            size = min(count - start, self.chunk_size - self._chunks[-1])
+            first = self._chunks[-1]
+            for values, (name, _) in zip(rows, COLUMNS):
+                self._columns[name][first:first + size] = values[start:start + size]
+            self._chunks[-1] += size
+            self._rows += size
+            start += size
+
+    def __new_chunk(self):
+        # Complete the current chunk and preallocate the next one
+        self.__flush()
+        chunk = len(self._chunks)
+        self._columns = {name: np.lib.format.open_memmap(
+            os.path.join(self.path, f'{name}.{chunk:05d}.npy'), mode='w+', dtype=dtype,
+            shape=(self.chunk_size,) + self._shapes[name]) for name, dtype in COLUMNS}
+        self._chunks.append(0)
+
+    def __flush(self):
+        # Write chunk columns and the index
+        for column in self._columns.values():
+            column.flush()
+        index = {
+            'chunk_size': self.chunk_size,
+            'columns': {name: {'dtype': dtype, 'shape': list(self._shapes[name])} for name, dtype in COLUMNS},
+            'chunks': self._chunks,
+        }
+        with open(os.path.join(self.path, INDEX), 'w') as file:
+            json.dump(index, file)
+
+    def close(self):
+        # Write all queued rows and the final index
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.__flush()
+        self._columns = {}
+        if self._error is not None:
+            raise RuntimeError("Transition writer failed.") from self._error
+
+
+class TransitionReader:
+    """
+    Read transitions written by `TransitionWriter`, without loading them all.
+
+    Chunks are memory-mapped, and only the rows of each mini-batch are read.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the transitions.
+
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+
+        # Read index, and map chunks
+        with open(os.path.join(path, INDEX)) as file:
+            index = json.load(file)
+        self.path = path
+        self.chunks: List[int] = [rows for rows in index['chunks'] if rows > 0]
+        self._columns = [{name: np.load(os.path.join(path, f'{name}.{chunk:05d}.npy'), mmap_mode='r')
+                          for name, _ in COLUMNS} for chunk in range(len(self.chunks))]
+
+    def __len__(self) -> int:
+        return sum(self.chunks)
+
+    def chunk(self, chunk: int) -> Dict[str, np.ndarray]:
+        # Get read-only views of the rows of a chunk
+        return {name: column[:self.chunks[chunk]] for name, column in self._columns[chunk].items()}
+
+    def batches(self, batch_size: int, shuffle: bool = True, seed: int = None, chunks_per_block: int = 4,
+                drop_last: bool = False) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yield mini-batches of transitions.
+
+        When shuffling, chunks are visited in random order, a few chunks at a time, and rows are shuffled across the
+        chunks of each block. Only the rows of the current batch are read in memory.
+
+        Parameters
+        ----------
+        batch_size : int
+            Rows of each mini-batch.
+        shuffle : bool, optional
+            If True rows are shuffled, otherwise they are read in order. The default is True.
+        seed : int, optional
+            Seed of the shuffling. The default is None.
+        chunks_per_block : int, optional
+            Number of chunks whose rows are shuffled together. The default is 4.
+        drop_last : bool, optional
+            If True drop the last batch if smaller than batch_size. The default is False.
+
+        Yields
+        ------
+        batch : Dict[str, np.ndarray]
+            Observations, actions, rewards and done flags of the batch.
+
+        """
+        if not self.chunks:
+            return
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.chunks)) if shuffle else np.arange(len(self.chunks))
+
+        # Collect (chunk, row) pairs of each block, carrying leftover rows to the next block
+        pending = np.zeros((0, 2), dtype='int64')
+        for first in range(0, len(order), chunks_per_block):
+            block = [np.stack([np.full(self.chunks[c], c), np.arange(self.chunks[c])], axis=1)
+                     for c in order[first:first + chunks_per_block]]
+            rows = np.concatenate([pending] + block)
+            if shuffle:
+                rows = rows[rng.permutation(len(rows))]
+            full = len(rows) - len(rows) % batch_size
+            for start in range(0, full, batch_size):
+                yield self.__read(rows[start:start + batch_size])
+            pending = rows[full:]
+
+        if len(pending) and not drop_last:
+            yield self.__read(pending)
+
+    def __read(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        # Gather rows from their chunks, reading each chunk in increasing row order
+        batch = {name: np.empty((len(rows),) + self._columns[0][name].shape[1:], dtype=dtype)
+                 for name, dtype in COLUMNS}
+        for chunk in np.unique(rows[:, 0]):
+            where = np.flatnonzero(rows[:, 0] == chunk)
+            where = where[np.argsort(rows[where, 1], kind='stable')]
+            for name, column in self._columns[chunk].items():
+                batch[name][where] = column[rows[where, 1]]
+        return batch
@@ -1,35 +1,100 @@
+import copy
 import numpy as np
-import random
-from typing import Union, Callable, Sequence, Dict
+import time
+from typing import Union, Callable, Sequence, Dict, List, Tuple
 
 import game_rules
+from game_rules.streams import copy_generator, pack_generator_state, unpack_generator_state
+from game_rules.transforms import DIRECTIONS, STEPS, TURNS, egocentric
+from Game.analysis import FieldAnalysis, SnakeAnalysis
+from Game.chunked_grid import BorderField, ChunkedGrid
+from Game.codec import ObservationCodec
+from Game.grid import Grid
+from Game.profiler import Profiler
+from Snake.policy import ObservationBuffer, is_batched, uses_analysis, uses_rng
 from Snake.snake import Snake
 
 
 class Environment:
-    def __init__(self, game_mode: str = 'field', width: int = 10, height: int = 10, border: bool = False):
+    """
+    A game of many snakes on a field.
+
+    All randomness of the game (food positions, start directions and the streams of the snakes) comes from one
+    `numpy.random.Generator`, seeded by `seed`, so that each game can be played again bit for bit. Uniform numbers
+    used to place food are drawn in batches of `food_batch`, and start directions and seeds of the snakes' streams
+    are drawn all at once in `setup`. Use `spawn_seeds` to get independent seeds for other environments, e.g. workers.
+
+    With `field_backend='chunked'` the field is stored in chunks, and only the windowed game modes ('head' and 'body')
+    are supported, since 'field' observations are as large as the whole field. `field` is then a `BorderField`.
+
+    """
+
+    # Number of uniform numbers drawn at once to place food
+    food_batch: int = 256
+
+    def __init__(self, game_mode: str = 'field', width: int = 10, height: int = 10, border: bool = False,
+                 seed: Union[int, np.random.SeedSequence] = None,
+                 field_backend: str = game_rules.FieldBackends.dense):
         super().__init__()
+        assert field_backend != game_rules.FieldBackends.chunked or game_mode != game_rules.GameModes.field, \
+            f"Game mode {game_mode} not supported by the {field_backend} field backend, use a windowed game mode."
 
         # Init attributes
         self.__game_mode = game_mode
         self._width = width
         self._height = height
         self.__border = border
+        self.__field_backend = field_backend
         self.__snakes: Dict[int, Snake] = {}
         self._food_x = self._food_y = 0
         self.game_properties: dict = {}
-        self.__rotation_dir: Sequence[str] = ('n', 'e', 's', 'w')
         self.__snake_num_offset: int = 2
-
-        # Init field matrix
-        self._field = np.zeros((width - self.__border*2, height - self.__border*2), dtype=bool)
-        if self.__border:
-            self._field = np.pad(self._field, ((1, 1), (1, 1)), constant_values=True)
+        self._seed = seed
+        self.__seeds = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._rng = np.random.Generator(np.random.PCG64(self.__seeds))
+        self.__uniforms: List[float] = []
+        self.__drawn = 0
+        self.__batch_state = self._rng.bit_generator.state
+        self.__buffer = ObservationBuffer()
+        self.__analysis: Union[Tuple[object, int, FieldAnalysis], None] = None
+        self.__codec: Union[ObservationCodec, None] = None
+        self.recorder = None
+        self.profiler = None
+        self.executor = None
+
+        # Init field matrix, or compute walls on access when stored in chunks
+        if self.__field_backend == game_rules.FieldBackends.chunked:
+            self._field = BorderField((height, width), border)
+        else:
+            self._field = np.zeros((height - self.__border*2, width - self.__border*2), dtype=bool)
+            if self.__border:
+                self._field = np.pad(self._field, ((1, 1), (1, 1)), constant_values=True)
+        self.__new_grid(0)
 
     @property
     def field(self):
         return self._field
 
+    @property
+    def game_mode(self):
+        return self.__game_mode
+
+    @property
+    def border(self):
+        return self.__border
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @property
+    def field_backend(self):
+        return self.__field_backend
+
+    @property
+    def num_snakes(self):
+        return len(self.__snakes)
+
     @property
     def width(self):
         return self._width
@@ -40,51 +105,79 @@ class Environment:
 
     @property
     def game_field(self):
-        # Get empty field
-        field = self.field.astype('int8') * 1
-
-        # Get food position
-        field[self._food_y, self._food_x] = -1
+        return self.__grid.labels
 
-        # Get snakes positions
-        for num, snake in self.__snakes.items():
-            if snake.alive or self.game_properties.get('keep_corpse', False):
-                for pos in snake.body:
-                    field[pos[1], pos[0]] = num if snake.alive else 1
-
-        return field
+    @property
+    def observation_field(self):
+        return self.__grid.observation
 
     def reset(self):
         # Reset field matrix
+        if not isinstance(self._field, np.ndarray):
+            return
         if self.__border:
             self._field[1:-2, 1:-2] = False
         else:
             self._field[:] = False
 
-    def __put_food(self):
-        # Get current game field
-        game_field = self.game_field > 0
-        updated_game_field = game_field.copy()
-
-        # Position food
-        food_x = food_y = 0
-        while np.sum(np.bitwise_xor(game_field, updated_game_field)) == 0:
-            food_x = random.randint(0, game_field.shape[1]-1)
-            food_y = random.randint(0, game_field.shape[0]-1)
-            updated_game_field[food_y, food_x] = True
+    def spawn_seeds(self, n: int) -> List[np.random.SeedSequence]:
+        # Get seeds of independent streams, e.g. for the environments of workers
+        return self.__seeds.spawn(n)
+
+    def __uniform(self) -> float:
+        # Get the next uniform number, drawing a new batch when needed
+        if self.__drawn == len(self.__uniforms):
+            self.__batch_state = self._rng.bit_generator.state
+            self.__uniforms = self._rng.random(self.food_batch).tolist()
+            self.__drawn = 0
+        self.__drawn += 1
+        return self.__uniforms[self.__drawn - 1]
+
+    def __put_food(self) -> bool:
+        # Pick a free cell, if any
+        food = self.__grid.sample_free(self.__uniform())
+        if food is None:
+            return False
 
         # Update field
-        self._food_x, self._food_y = food_x, food_y
+        self._food_x, self._food_y = food
+        self.__grid.move_food(*food)
+        return True
+
+    def __redraw(self):
+        # Draw the whole field again, e.g. when snakes die
+        profiler = self.profiler if self.profiler is not None and self.profiler.enabled else None
+        if profiler is not None:
+            start = profiler.clock()
+        keep_corpse = self.game_properties.get('keep_corpse', False)
+        snakes = [(num if snake.alive else 1, snake.body) for num, snake in self.__snakes.items()
+                  if snake.alive or keep_corpse]
+
+        # Draw living snakes over corpses when moving all at once, to be independent of the order of snakes
+        if self.game_properties.get('step_mode', None) == game_rules.StepModes.simultaneous:
+            snakes.sort(key=lambda snake: snake[0] > 1)
+        self.__grid.redraw(
+            snakes=snakes,
+            corpses=[snake.body for snake in self.__snakes.values() if not snake.alive and keep_corpse],
+        )
+        if profiler is not None:
+            profiler.add('redraw', profiler.clock() - start, nested=True)
 
     def setup(self, move_snakes: Sequence[Callable] = (), len_snakes: Union[Sequence[int], int] = 3,
               pos_snakes: Union[Sequence[Union[None, tuple]], None] = None, food_score: int = 1, kill_score: int = 5,
-              recognize_enemies: bool = False, keep_corpse: bool = False):
+              recognize_enemies: bool = False, keep_corpse: bool = False, fov_head: Union[int, tuple] = 4,
+              fov_head_offset: int = 0, fov_body: int = 1, step_mode: str = game_rules.StepModes.sequential):
         # Store game properties
+        fov_head = (fov_head, fov_head) if isinstance(fov_head, int) else tuple(fov_head)
         self.game_properties = {
             'food_score': food_score,
             'kill_score': kill_score,
             'recognize_enemies': recognize_enemies,
             'keep_corpse': keep_corpse,
+            'fov_head': fov_head,
+            'fov_head_offset': fov_head_offset,
+            'fov_body': fov_body,
+            'step_mode': step_mode,
         }
 
         # Normalize inputs
@@ -94,79 +187,340 @@ class Environment:
         assert (len(len_snakes) == num_snakes) and (len(pos_snakes) == num_snakes), \
             f"Invalid number of snakes. Expected: {num_snakes}, got {len(len_snakes)} and {len(pos_snakes)}."
 
-        # Put food
-        self.__put_food()
+        # Draw start directions and seeds of the snakes' streams, then start a new batch of uniform numbers
+        directions = self._rng.integers(4, size=num_snakes).tolist()
+        seeds = self._rng.integers(np.iinfo('int64').max, size=num_snakes).tolist()
+        self.__uniforms, self.__drawn = [], 0
+        self.__batch_state = self._rng.bit_generator.state
 
-        # Clear current snakes
+        # Clear current snakes and field
         self.__snakes = {}
+        self.__new_grid(num_snakes)
+
+        # Put food
+        self.__put_food()
 
         # Initialize snakes
         for num, (move_snake, len_snake, pos_snake) in enumerate(zip(move_snakes, len_snakes, pos_snakes)):
-            if pos_snake is None:
+            on_food = pos_snake is None
+            if on_food:
                 pos_snake = self._food_x, self._food_y
-                self.__put_food()
-            snake = Snake(pos=[pos_snake], length=len_snake)
+            snake = Snake(pos=[pos_snake], length=len_snake, direction=DIRECTIONS[directions[num]], seed=seeds[num])
+            assert self.__grid.get(*snake.head) <= 0, f"Invalid position {snake.head} for snake {num}, cell is taken."
             snake.set_move_method(self.__game_mode, move_snake)
             self.__snakes[num+self.__snake_num_offset] = snake
+            self.__grid.set(*snake.head, num+self.__snake_num_offset)
+            if on_food:
+                self.__put_food()
+
+    def __new_grid(self, num_snakes: int):
+        # Create an empty field, with halo large enough for the fields of view and labels for all snakes
+        fov_head = self.game_properties.get('fov_head', (0, 0))
+        fov_head_offset = self.game_properties.get('fov_head_offset', 0)
+        if self.__game_mode == game_rules.GameModes.head:
+            halo = max(fov_head) + abs(fov_head_offset)
+        elif self.__game_mode == game_rules.GameModes.body:
+            halo = max(max(fov_head) + abs(fov_head_offset), self.game_properties.get('fov_body', 0))
+        else:
+            halo = 0
+        clip = self.__snake_num_offset if self.game_properties.get('recognize_enemies', False) else None
+        dtype = 'int8' if num_snakes + self.__snake_num_offset <= np.iinfo('int8').max else 'int16'
+        if self.__field_backend == game_rules.FieldBackends.chunked:
+            self.__grid = ChunkedGrid((self._height, self._width), clip=clip, halo=halo, wrap=not self.__border,
+                                      dtype=dtype, border=self.__border)
+        else:
+            self.__grid = Grid(self._field, clip=clip, halo=halo, wrap=not self.__border, dtype=dtype)
+
+    def set_food(self, x: int, y: int):
+        # Move food to a given position
+        self._food_x, self._food_y = x, y
+        self.__grid.move_food(x, y)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """
+        Get a compact copy of the game state.
+
+        Returns
+        -------
+        state : Dict[str, np.ndarray]
+            Food position, and directions, lengths, scores, alive flags, body lengths and bodies (concatenated from
+            tail to head) of all snakes.
+
+        """
+        snakes = list(self.__snakes.values())
+        return {
+            'food': np.array([self._food_x, self._food_y], dtype='int16'),
+            'directions': np.array([snake.direction_index for snake in snakes], dtype='int8'),
+            'lengths': np.array([snake.len for snake in snakes], dtype='int32'),
+            'scores': np.array([snake.score for snake in snakes], dtype='int32'),
+            'alive': np.array([snake.alive for snake in snakes], dtype=bool),
+            'body_lengths': np.array([len(snake.body) for snake in snakes], dtype='int32'),
+            'bodies': np.concatenate([snake.body for snake in snakes]) if snakes else np.zeros((0, 2), 'int16'),
+        }
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        # Restore snakes
+        assert len(state['directions']) == len(self.__snakes), \
+            f"Invalid number of snakes. Expected: {len(self.__snakes)}, got {len(state['directions'])}."
+        bodies = np.split(np.asarray(state['bodies']), np.cumsum(state['body_lengths'])[:-1])
+        for ii, snake in enumerate(self.__snakes.values()):
+            snake.set_body(bodies[ii])
+            snake.direction_index = int(state['directions'][ii])
+            snake.len = int(state['lengths'][ii])
+            snake.score = int(state['scores'][ii])
+            snake.alive = bool(state['alive'][ii])
+
+        # Draw field from scratch
+        self.__new_grid(len(self.__snakes))
+        self.set_food(*(int(p) for p in state['food']))
+        self.__redraw()
+
+    def snapshot(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Pack the whole game state into one contiguous buffer.
+
+        The buffer holds food position, snakes' directions, lengths, scores and alive flags, the state of the random
+        generator and of the snakes' streams, the grid arrays (labels, clipped labels and free cells index) and the
+        bodies, so that `restore` only copies memory. It can be restored into this environment or any clone of it.
+
+        Parameters
+        ----------
+        out : np.ndarray, optional
+            Buffer of bytes to reuse, if large enough. The default is None.
+
+        Returns
+        -------
+        snapshot : np.ndarray
+            Packed state, as bytes.
+
+        """
+        # Collect state arrays
+        snakes = list(self.__snakes.values())
+        header = np.array([self._food_x, self._food_y] + [
+            value for snake in snakes
+            for value in (snake.direction_index, snake.len, snake.score, snake.alive, len(snake.body))
+        ], dtype='int32')
+        rng = np.array(pack_generator_state(self.__batch_state) + [len(self.__uniforms), self.__drawn] + [
+            word for snake in snakes for word in snake.get_rng_state()
+        ], dtype='uint64')
+        arrays = (header, rng) + self.__grid.arrays + tuple(snake.body for snake in snakes)
+
+        # Copy arrays one after the other
+        size = sum(values.nbytes for values in arrays)
+        if out is None or out.size < size:
+            out = np.empty(size, dtype='uint8')
+        offset = 0
+        for values in arrays:
+            out[offset:offset + values.nbytes] = values.reshape(-1).view('uint8')
+            offset += values.nbytes
+
+        return out[:size]
+
+    def restore(self, snapshot: np.ndarray):
+        # Read food position and snakes' state
+        snapshot = np.frombuffer(snapshot, dtype='uint8')
+        snakes = list(self.__snakes.values())
+        offset = 4 * (2 + 5 * len(snakes))
+        header = snapshot[:offset].view('int32').tolist()
+        self._food_x, self._food_y = header[:2]
+        for ii, snake in enumerate(snakes):
+            snake.direction_index, snake.len, snake.score, alive, _ = header[2 + 5*ii:7 + 5*ii]
+            snake.alive = bool(alive)
+
+        # Restore random generator, drawing again the current batch of uniform numbers, and the snakes' streams
+        rng = snapshot[offset:offset + 8 * (8 + 8 * len(snakes))].view('uint64').tolist()
+        offset += 8 * (8 + 8 * len(snakes))
+        self.__batch_state = unpack_generator_state(rng[:6])
+        self._rng.bit_generator.state = self.__batch_state
+        self.__uniforms = self._rng.random(rng[6]).tolist() if rng[6] else []
+        self.__drawn = rng[7]
+        for ii, snake in enumerate(snakes):
+            snake.set_rng_state(rng[8 + 8*ii:16 + 8*ii])
+
+        # Copy grid arrays in place
+        offset = self.__grid.load(snapshot, offset)
+        self.__grid.food = (self._food_x, self._food_y)
+
+        # Copy bodies
+        for ii, snake in enumerate(snakes):
+            count = header[6 + 5*ii]
+            snake.set_body(snapshot[offset:offset + 4 * count].view('int16'))
+            offset += 4 * count
+        assert offset == snapshot.size, f"Invalid snapshot size. Expected: {offset}, got {snapshot.size}."
+
+    def clone(self) -> 'Environment':
+        # Get an independent copy of the game, sharing walls, moving methods and the sequence of spawned seeds
+        environment = copy.copy(self)
+        environment.game_properties = dict(self.game_properties)
+        environment.__snakes = {num: snake.copy() for num, snake in self.__snakes.items()}
+        environment.__grid = copy.deepcopy(self.__grid)
+        environment._rng = copy_generator(self._rng)
+        environment.__uniforms = list(self.__uniforms)
+        environment.__buffer = ObservationBuffer()
+        environment.__analysis = None
+        environment.__codec = None
+        environment.recorder = None
+        environment.profiler = None
+        environment.executor = None
+        return environment
 
     def send_commands(self, commands: dict):
         # Update snakes' direction based on commands
         for num, snake in self.__snakes.items():
             direction = commands.get(num-self.__snake_num_offset, None)
             if direction is not None:
-                snake.direction = 'nesw'[direction % 4]
+                snake.direction_index = direction % 4
+
+    def get_move_methods(self) -> Dict[int, Callable]:
+        # Get moving methods of living snakes, by player
+        return {num-self.__snake_num_offset: snake.get_move_method(self.__game_mode)
+                for num, snake in self.__snakes.items() if snake.alive}
 
-    def update(self):
-        # Store collisions
+    @property
+    def analysis(self) -> FieldAnalysis:
+        # Get the analysis of the field, computed again only when the field changed
+        key = (self.__grid, self.__grid.version)
+        if self.__analysis is None or self.__analysis[:2] != key:
+            heads = {num: snake.head for num, snake in self.__snakes.items() if snake.alive}
+            self.__analysis = key + (FieldAnalysis(self.game_field, (self._food_x, self._food_y), heads,
+                                                   wrap=not self.__border),)
+        return self.__analysis[2]
+
+    def get_analysis(self, player: int) -> SnakeAnalysis:
+        # Get the analysis of the field as seen by a player
+        num = player + self.__snake_num_offset
+        snake = self.__snakes[num]
+        return SnakeAnalysis(self.analysis, num, snake.head, snake.direction_index)
+
+    def get_rng(self, player: int) -> np.random.Generator:
+        # Get the random stream of a player, passed to moving methods flagged with `with_rng`
+        return self.__snakes[player+self.__snake_num_offset].rng
+
+    def observe(self, player: int) -> tuple:
+        # Get the arguments of the moving method of a player
+        return self.__observation(self.__snakes[player+self.__snake_num_offset])
+
+    @property
+    def codec(self) -> ObservationCodec:
+        # Get the codec of bit-packed observations of this field
+        if self.__codec is None:
+            self.__codec = ObservationCodec((self._height, self._width))
+        return self.__codec
+
+    def encode_observation(self, player: int, out: np.ndarray = None) -> np.ndarray:
+        # Get the field as seen by a player, bit-packed in channels by `codec`
+        return self.codec.encode(self.game_field, player+self.__snake_num_offset, out=out)
+
+    def __observation(self, snake: Snake) -> tuple:
+        # Prepare shared arguments for move function
+        food_pos = egocentric((self._food_x, self._food_y), snake.head, snake.direction_index)
+        body = egocentric(snake.body, snake.head, snake.direction_index)
+        args = (
+            food_pos if self.__border else
+            (food_pos[0] if abs(food_pos[0]) <= self.width//2 else self.width//2 - food_pos[0],
+             food_pos[1] if abs(food_pos[1]) <= self.height//2 else self.height//2 - food_pos[1]),
+            body,
+        )
+
+        # Add fields seen by the snake
+        if self.__game_mode == game_rules.GameModes.field:
+            return args + (self.observation_field,)
+        elif self.__game_mode == game_rules.GameModes.head:
+            return args + (self.__head_field(snake),)
+        elif self.__game_mode == game_rules.GameModes.body:
+            return args + (self.__head_field(snake), self.__body_field(snake))
+        return args
+
+    def update(self, moves: Dict[int, int] = None):
+        # Time phases only when profiling
+        profiler = self.profiler if self.profiler is not None and self.profiler.enabled else None
+        if profiler is not None:
+            start = profiler.clock()
+
+        # Get moves of batched moving methods all at once, from observations at the start of the tick
+        moves = batched_moves([self], [moves or {}], self.__buffer)[0]
+        if profiler is not None:
+            batched = profiler.clock()
+            profiler.add('batched_moves', batched - start)
+
+        # Get moves of the other moving methods at once too, when calling them concurrently
+        if self.executor is not None:
+            moves = self.executor.moves(self, moves)
+        if profiler is not None:
+            collected = profiler.clock()
+            if self.executor is not None:
+                profiler.add('concurrent_moves', collected - batched)
+            profiler.nested = 0
+
+        # Move snakes, one after the other or all at once
+        if self.game_properties.get('step_mode', None) == game_rules.StepModes.simultaneous:
+            eat = self.__step_simultaneous(moves, profiler)
+        else:
+            eat = self.__step_sequential(moves, profiler)
+        if profiler is not None:
+            step = profiler.clock()
+            profiler.add('step', step - collected - profiler.nested)
+
+        # Update food position
+        if eat:
+            self.__put_food()
+        if profiler is not None:
+            food = profiler.clock()
+            profiler.add('food', food - step)
+            profiler.count('food_eaten', int(eat))
+
+        # Record game step
+        if self.recorder is not None:
+            self.recorder.record(self)
+            if profiler is not None:
+                profiler.add('record', profiler.clock() - food)
+        if profiler is not None:
+            profiler.add('tick', profiler.clock() - start)
+            profiler.count('ticks')
+
+    def __get_move(self, num: int, snake: Snake, moves: Dict[int, int]) -> int:
+        # Get the move of a snake, calling its moving method if not given
+        move = moves.get(num-self.__snake_num_offset, None)
+        if move is not None:
+            return max(min(int(move), 1), -1)
+
+        # Time the moving method when profiling
+        profiler = self.profiler if self.profiler is not None and self.profiler.enabled else None
+        if profiler is not None:
+            start = profiler.clock()
+        method = snake.get_move_method(self.__game_mode)
+        kwargs = {}
+        if uses_analysis(method):
+            kwargs['analysis'] = SnakeAnalysis(self.analysis, num, snake.head, snake.direction_index)
+        if uses_rng(method):
+            kwargs['rng'] = snake.rng
+        move = snake.move(self.__game_mode, *self.__observation(snake), **kwargs)
+        if profiler is not None:
+            profiler.add_move(num-self.__snake_num_offset, method, profiler.clock() - start)
+        return move
+
+    def __step_sequential(self, moves: Dict[int, int], profiler: Profiler = None) -> bool:
+        # Store collisions, and time spent changing directions and checking collisions when profiling
         collisions = []
+        directions_ns = collisions_ns = 0
 
         # Move snakes
         eat = False
-        for snake in self.__snakes.values():
+        for num, snake in self.__snakes.items():
             if not snake.alive:
                 continue
 
-            # Prepare shared arguments for move function
-            food_pos = np.array([self._food_x - snake.x, self._food_y - snake.y])
-            body = np.array(snake.body) - snake.head
-            num_rotations = 'nwse'.index(snake.direction)
-            food_pos = self.__rotate(food_pos * [1, -1], num_rotations)
-            body = self.__rotate(body * [1, -1], num_rotations)
-            args = (
-                self.__game_mode,
-                food_pos if self.__border else
-                (food_pos[0] if abs(food_pos[0]) <= self.width//2 else self.width//2 - food_pos[0],
-                 food_pos[1] if abs(food_pos[1]) <= self.height//2 else self.height//2 - food_pos[1]),
-                body,
-            )
-
             # Move snake
-            if self.__game_mode == game_rules.GameModes.field:
-                game_field = np.clip(self.game_field, 0,
-                                     self.__snake_num_offset if self.game_properties.get('recognize_enemies', False) else None)
-                move = snake.move(*args, game_field)
-            elif self.__game_mode == game_rules.GameModes.head:
-                # TODO
-                move = snake.move(*args, self.game_field)
-            elif self.__game_mode == game_rules.GameModes.body:
-                # TODO
-                move = snake.move(*args, self.game_field)
-            else:
-                move = snake.move(*args)
+            move = self.__get_move(num, snake, moves)
 
             # Update head
-            snake.direction = self.__rotation_dir[(self.__rotation_dir.index(snake.direction) + move) % 4]
-            if snake.direction == 'n':
-                head_add = (0, -1)
-            elif snake.direction == 'e':
-                head_add = (1, 0)
-            elif snake.direction == 's':
-                head_add = (0, 1)
-            elif snake.direction == 'w':
-                head_add = (-1, 0)
-            else:
-                raise ValueError(f"Snake direction {snake.direction} not understood.")
-            head = (snake.head[0] + head_add[0]) % self._width, (snake.head[1] + head_add[1]) % self._height
+            if profiler is not None:
+                clock = profiler.clock()
+            snake.direction_index = int(TURNS[snake.direction_index, move + 1])
+            head_add = STEPS[snake.direction_index]
+            head = int(snake.head[0] + head_add[0]) % self._width, int(snake.head[1] + head_add[1]) % self._height
+            if profiler is not None:
+                directions_ns += profiler.clock() - clock
 
             # Check for food eat
             if head == (self._food_x, self._food_y):
@@ -175,7 +529,9 @@ class Environment:
                 eat = True
 
             # Check for collision
-            collision = snake.check_collision(self.game_field, head)
+            if profiler is not None:
+                clock = profiler.clock()
+            collision = self.__grid.get(*head)
             if collision > 0:
                 snake.alive = False
                 collisions.append(collision)
@@ -183,26 +539,218 @@ class Environment:
             # Kill snakes due to head-to-head collision
             if collision in self.__snakes and self.__snakes[collision].head == snake.head:
                 self.__snakes[collision].alive = False
+            if profiler is not None:
+                collisions_ns += profiler.clock() - clock
 
             # Perform movement
-            snake.update(head)
+            tail = snake.update(head)
+
+            # Update field where the snake moved, or draw it again if any snake died
+            if collision > 0:
+                self.__redraw()
+            else:
+                if tail is not None:
+                    self.__grid.clear(*tail)
+                self.__grid.set(*head, num)
 
         # Give points for collisions
         for num, snake in self.__snakes.items():
             if snake.alive:
                 snake.score += self.game_properties.get('kill_score', 5) * collisions.count(num)
+        if profiler is not None:
+            profiler.add('directions', directions_ns, nested=True)
+            profiler.add('collisions', collisions_ns, nested=True)
+
+        return eat
+
+    def __step_simultaneous(self, moves: Dict[int, int], profiler: Profiler = None) -> bool:
+        """
+        Move all living snakes at once.
+
+        Every snake picks its move from the field at the start of the tick. Then all new heads are computed together,
+        and a snake dies if its head enters a wall, a corpse or a body cell that is not left by a tail in this tick,
+        or the same cell as another head. Food is eaten only by a head entering its cell alone, and a snake that eats
+        keeps its tail. Kill points go to the living owner of each body that was hit.
+
+        Parameters
+        ----------
+        moves : Dict[int, int]
+            Moves already known, by player.
+        profiler : Profiler, optional
+            Profiler timing direction changes and collision checks, if any.
+
+        Returns
+        -------
+        eat : bool
+            True if the food was eaten.
+
+        """
+        # Get moves of all living snakes, before changing anything
+        nums = [num for num, snake in self.__snakes.items() if snake.alive]
+        if not nums:
+            return False
+        snakes = [self.__snakes[num] for num in nums]
+        turns = np.array([self.__get_move(num, snake, moves) for num, snake in zip(nums, snakes)])
+
+        # Compute all new heads, as flat cell ids
+        if profiler is not None:
+            clock = profiler.clock()
+        width, height = self._width, self._height
+        directions = TURNS[[snake.direction_index for snake in snakes], turns + 1]
+        heads = np.array([snake.head for snake in snakes]) + STEPS[directions]
+        heads %= (width, height)
+        cells = heads[:, 1] * width + heads[:, 0]
+        _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        head_on = counts[inverse.reshape(-1)] > 1
+        if profiler is not None:
+            directions_end = profiler.clock()
+            profiler.add('directions', directions_end - clock, nested=True)
+
+        # Resolve food contention, then find tails left in this tick
+        eaten = (cells == self._food_y * width + self._food_x) & ~head_on
+        tails = np.array([snake.body[0] for snake in snakes])
+        lengths = np.array([snake.len for snake in snakes]) + eaten
+        moving_tails = np.array([len(snake.body) for snake in snakes]) >= lengths
+        left = np.isin(cells, tails[moving_tails, 1] * width + tails[moving_tails, 0])
+
+        # Find head-on and head-to-body collisions
+        hit = self.__grid.get_cells(heads).astype('int64')
+        hit[left] = 0
+        dead = (hit > 0) | head_on
+        if profiler is not None:
+            profiler.add('collisions', profiler.clock() - directions_end, nested=True)
 
-        # Update food position
-        if eat:
-            self.__put_food()
+        # Move snakes
+        food_score = self.game_properties.get('food_score', 1)
+        for snake, direction, head, snake_dead, snake_eats in zip(snakes, directions.tolist(), heads.tolist(),
+                                                                   dead.tolist(), eaten.tolist()):
+            snake.direction_index = direction
+            if snake_eats:
+                snake.len += 1
+                snake.score += food_score
+            if snake_dead:
+                snake.alive = False
+            snake.update(head)
 
-    @staticmethod
-    def __rotate(vect, k):
-        rot = np.array([[np.cos(np.pi/2 * k), -np.sin(np.pi/2 * k)], [np.sin(np.pi/2 * k), np.cos(np.pi/2 * k)]])
-        return np.round(np.array(vect).dot(rot)).astype('int32')
+        # Give points for bodies hit
+        owners = np.bincount(hit[dead & (hit >= self.__snake_num_offset)], minlength=max(self.__snakes) + 1)
+        kill_score = self.game_properties.get('kill_score', 5)
+        for num, snake in self.__snakes.items():
+            if snake.alive and owners[num]:
+                snake.score += kill_score * int(owners[num])
+
+        # Update field where snakes moved
+        for x, y in tails[moving_tails].tolist():
+            self.__grid.clear(x, y)
+        for num, (x, y), snake_dead in zip(nums, heads.tolist(), dead.tolist()):
+            if not snake_dead:
+                self.__grid.set(x, y, num)
+
+        # Turn dead snakes into corpses, or remove them, leaving cells of living snakes untouched
+        living = {num for num, snake in self.__snakes.items() if snake.alive}
+        keep_corpse = self.game_properties.get('keep_corpse', False)
+        # A head that met another one is cleared only if its cell was empty or food, not part of a third snake
+        clear_head = head_on & (hit <= 0)
+        for num, snake, snake_dead, snake_clear_head in zip(nums, snakes, dead.tolist(), clear_head.tolist()):
+            if not snake_dead:
+                continue
+            body = snake.body.tolist()
+            if keep_corpse:
+                for x, y in body:
+                    self.__grid.add_wall(x, y)
+                    if self.__grid.get(x, y) not in living:
+                        self.__grid.set(x, y, 1)
+            else:
+                for x, y in body[:-1] + (body[-1:] if snake_clear_head else []):
+                    self.__grid.clear(x, y)
+
+        return bool(eaten.any())
+
+    def __head_field(self, snake: Snake) -> np.ndarray:
+        # Get the window seen by the snake head, centered ahead of it by the offset
+        ahead, side = self.game_properties['fov_head']
+        step = STEPS[snake.direction_index] * self.game_properties['fov_head_offset']
+        if snake.direction_index % 2 == 0:
+            window = self.__grid.window(snake.x + step[0], snake.y + step[1], ahead, side)
+        else:
+            window = self.__grid.window(snake.x + step[0], snake.y + step[1], side, ahead)
+
+        # Rotate the window so that the snake is facing up
+        return np.rot90(window, snake.direction_index)
+
+    def __body_field(self, snake: Snake) -> np.ndarray:
+        # Get the windows sensed by each body block, rotated so that the snake is facing up
+        windows = self.__grid.windows(snake.body, self.game_properties['fov_body'])
+        return np.rot90(windows, snake.direction_index, axes=(1, 2))
 
     def game_over(self):
         return all(not snake.alive for snake in self.__snakes.values())
 
     def get_scores(self):
         return [snake.score for snake in self.__snakes.values()]
+
+    def get_lengths(self):
+        return [snake.len for snake in self.__snakes.values()]
+
+    def get_alive(self):
+        return [snake.alive for snake in self.__snakes.values()]
+
+    def get_directions(self):
+        return [snake.direction_index for snake in self.__snakes.values()]
+
+
+def batched_moves(environments: Sequence[Environment], moves: Sequence[Dict[int, int]] = None,
+                  buffer: ObservationBuffer = None) -> List[Dict[int, int]]:
+    """
+    Get the moves of all snakes driven by batched moving methods, calling each method once.
+
+    Parameters
+    ----------
+    environments : Sequence[Environment]
+        Environments to get moves for.
+    moves : Sequence[Dict[int, int]], optional
+        Moves already known in each environment, by player. These snakes are skipped.
+    buffer : ObservationBuffer, optional
+        Buffer where to stack observations. Pass the same buffer at each tick to reuse its arrays.
+
+    Returns
+    -------
+    moves : List[Dict[int, int]]
+        Moves in each environment, by player, including the given ones.
+
+    """
+    # Group snakes by moving method
+    moves = [dict(env_moves) for env_moves in moves] if moves is not None else [{} for _ in environments]
+    groups: Dict[int, list] = {}
+    for env, env_moves in zip(environments, moves):
+        for player, method in env.get_move_methods().items():
+            if player not in env_moves and is_batched(method):
+                groups.setdefault(id(method), [method]).append((env, env_moves, player))
+
+    # Call each method once with stacked observations
+    buffer = buffer if buffer is not None else ObservationBuffer()
+    for method, *snakes in groups.values():
+        observations = buffer.stack([env.observe(player) for env, _, player in snakes])
+        kwargs = {}
+        if uses_analysis(method):
+            kwargs['analysis'] = [env.get_analysis(player) for env, _, player in snakes]
+        if uses_rng(method):
+            kwargs['rng'] = [env.get_rng(player) for env, _, player in snakes]
+        profilers = {id(env.profiler): env.profiler for env, _, _ in snakes
+                     if env.profiler is not None and env.profiler.enabled}
+        start = time.perf_counter_ns()
+        turns = np.clip(np.asarray(method(*observations, **kwargs)).astype('int64').reshape(-1), -1, 1)
+        for profiler in profilers.values():
+            profiler.add_policy(method, time.perf_counter_ns() - start)
+        for (_, env_moves, player), turn in zip(snakes, turns):
+            env_moves[player] = int(turn)
+
+    return moves
+
+
+def update_environments(environments: Sequence[Environment], buffer: ObservationBuffer = None):
+    # Do one game step in many environments, calling each batched moving method once
+    moves = batched_moves(environments, buffer=buffer)
+    for env, env_moves in zip(environments, moves):
+        if not env.game_over():
+            env.update(env_moves)
@@ -0,0 +1,146 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import time
+from typing import Callable, Dict, Union
+
+from Game.profiler import policy_name
+from Snake.policy import is_batched, uses_analysis, uses_rng
+from Snake.snake import move_straight
+
+
+def _call(method: Callable, args: tuple, kwargs: dict) -> tuple:
+    # Call a moving method, timing it where it runs
+    start = time.perf_counter()
+    move = method(*args, **kwargs)
+    return move, time.perf_counter() - start
+
+
+class PolicyExecutor:
+    """
+    Call the moving methods of all snakes at once, in a pool of threads or processes, with a deadline for each tick.
+
+    Attach an executor to `Environment.executor`: at each `Environment.update` all moving methods are called at the
+    same time, with the observations at the start of the tick, and the step goes on as soon as all of them returned
+    or the deadline expired. Snakes whose method missed the deadline go straight, as snakes with no moving method do.
+    A method still running from a previous tick is not called again until it returns, and its snake goes straight.
+    Tick latency is thus bounded by the deadline rather than by the sum of all methods.
+
+    Since every method sees the field at the start of the tick, snakes moving one after the other no longer see
+    the moves of the snakes before them, as for batched moving methods. Batched methods are still called once per
+    tick by the environment.
+
+    Parameters
+    ----------
+    deadline : float, optional
+        Time given to moving methods at each tick, in seconds. The default is 0.1.
+    processes : bool, optional
+        If True call methods in processes, so they must be picklable, otherwise in threads. The default is False.
+    max_workers : int, optional
+        Number of threads or processes. The default is enough for each snake to have its own.
+
+    """
+
+    def __init__(self, deadline: float = 0.1, processes: bool = False, max_workers: int = None):
+        super().__init__()
+
+        # Store arguments
+        self.deadline = deadline
+        self.processes = processes
+        self.max_workers = max_workers
+
+        # Init pool, calls still running by environment and player, and statistics by policy
+        self._pool: Union[ThreadPoolExecutor, ProcessPoolExecutor, None] = None
+        self._running: Dict[tuple, Future] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def __enter__(self) -> 'PolicyExecutor':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get statistics of each policy.
+
+        Returns
+        -------
+        stats : Dict[str, Dict[str, float]]
+            For each policy: number of 'calls', calls that missed the deadline ('timeouts'), ticks skipped because
+            the policy was still running ('busy'), and 'total_time' and 'max_time' in seconds of completed calls.
+
+        """
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def __policy(self, method: Callable) -> Dict[str, float]:
+        # Get statistics of a policy, creating them if needed
+        name = policy_name(method)
+        if name not in self._stats:
+            self._stats[name] = {'calls': 0, 'timeouts': 0, 'busy': 0, 'total_time': 0., 'max_time': 0.}
+        return self._stats[name]
+
+    def moves(self, environment, moves: Dict[int, int] = None) -> Dict[int, int]:
+        """
+        Get the moves of all living snakes of an environment.
+
+        Parameters
+        ----------
+        environment : Environment
+            Environment at the start of a tick.
+        moves : Dict[int, int], optional
+            Moves already known, by player. These snakes are skipped.
+
+        Returns
+        -------
+        moves : Dict[int, int]
+            Moves by player, including the given ones. Snakes with no moving method are left out.
+
+        """
+        moves = dict(moves or {})
+        if self._pool is None:
+            workers = self.max_workers or max(environment.num_snakes, 1)
+            self._pool = ProcessPoolExecutor(workers) if self.processes else ThreadPoolExecutor(workers)
+
+        # Send all calls at once, skipping methods still running from previous ticks
+        futures = {}
+        for player, method in environment.get_move_methods().items():
+            if player in moves or method is None or method is move_straight or is_batched(method):
+                continue
+            stats = self.__policy(method)
+            key = (id(environment), player)
+            if key in self._running and not self._running[key].done():
+                stats['busy'] += 1
+                moves[player] = 0
+                continue
+            kwargs = {'analysis': environment.get_analysis(player)} if uses_analysis(method) else {}
+            if uses_rng(method):
+                # Processes get a child stream, since draws there are not carried back
+                rng = environment.get_rng(player)
+                kwargs['rng'] = np.random.default_rng(rng.integers(np.iinfo('int64').max)) if self.processes else rng
+            futures[player] = (method, self._pool.submit(_call, method, environment.observe(player), kwargs))
+            stats['calls'] += 1
+
+        # Collect moves until the deadline, then go straight
+        wait([future for _, future in futures.values()], timeout=self.deadline)
+        for player, (method, future) in futures.items():
+            stats = self.__policy(method)
+            if future.done():
+                move, elapsed = future.result()
+                moves[player] = max(min(int(move), 1), -1)
+                stats['total_time'] += elapsed
+                stats['max_time'] = max(stats['max_time'], elapsed)
+                self._running.pop((id(environment), player), None)
+            else:
+                moves[player] = 0
+                stats['timeouts'] += 1
+                self._running[(id(environment), player)] = future
+
+        return moves
+
+    def close(self):
+        # Stop the pool, without waiting for calls still running
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        self._running = {}
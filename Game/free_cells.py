@@ -0,0 +1,151 @@
+import numpy as np
+from typing import Union
+
+
+class FreeCells:
+    """
+    Index of the free cells of one or more boards.
+
+    Free cells of each board are kept in a dense array, together with the position of each cell in that array, so
+    that adding, removing and sampling a cell are all O(1). Removal swaps the removed cell with the last free one.
+    Cells are identified by their flat index, i.e. y * width + x.
+
+    All methods are vectorized over boards: `cells` and `boards` are broadcast together, and each board may appear
+    at most once per call.
+
+    Parameters
+    ----------
+    free : np.ndarray
+        Boolean mask of the free cells, with shape (cells,) for a single board or (boards, cells).
+
+    """
+
+    def __init__(self, free: np.ndarray):
+        super().__init__()
+
+        # Init index
+        free = np.asarray(free, dtype=bool)
+        free = free.reshape(-1, free.shape[-1])
+        self._cells = np.zeros(free.shape, dtype='int32')
+        self._pos = np.zeros(free.shape, dtype='int32')
+        self._count = np.zeros(free.shape[0], dtype='int32')
+        self.reset(free)
+
+    @property
+    def count(self) -> np.ndarray:
+        return self._count.copy()
+
+    @property
+    def arrays(self) -> tuple:
+        # Get the arrays holding the index, to be saved or overwritten in place
+        return self._cells, self._pos, self._count
+
+    def reset(self, free: np.ndarray, boards: Union[np.ndarray, int, None] = None):
+        # Select boards to rebuild
+        boards = np.arange(self._count.size) if boards is None else np.asarray(boards).reshape(-1)
+        free = np.asarray(free, dtype=bool).reshape(boards.size, -1)
+
+        # Put free cells first, keeping their order
+        order = np.argsort(~free, axis=1, kind='stable')
+        pos = np.empty_like(order)
+        np.put_along_axis(pos, order, np.broadcast_to(np.arange(order.shape[1]), order.shape), axis=1)
+        pos[~free] = -1
+
+        # Store index
+        self._cells[boards] = order
+        self._pos[boards] = pos
+        self._count[boards] = free.sum(axis=1)
+
+    def is_free(self, cells, boards=0) -> np.ndarray:
+        return self._pos[boards, cells] >= 0
+
+    def add(self, cells, boards=0):
+        # Add a single cell without array overhead
+        if isinstance(cells, int) and isinstance(boards, int):
+            if self._pos[boards, cells] < 0:
+                last = int(self._count[boards])
+                self._cells[boards, last] = cells
+                self._pos[boards, cells] = last
+                self._count[boards] = last + 1
+            return
+
+        # Keep cells not in the index yet
+        cells, boards = (a.reshape(-1) for a in np.broadcast_arrays(np.asarray(cells), np.asarray(boards)))
+        new = self._pos[boards, cells] < 0
+        cells, boards = cells[new], boards[new]
+
+        # Append cells
+        last = self._count[boards]
+        self._cells[boards, last] = cells
+        self._pos[boards, cells] = last
+        self._count[boards] = last + 1
+
+    def add_many(self, cells: np.ndarray, boards: np.ndarray):
+        # Add cells not in the index yet, with any number of cells per board (each cell at most once)
+        cells, boards = (a.reshape(-1) for a in np.broadcast_arrays(np.asarray(cells), np.asarray(boards)))
+        new = self._pos[boards, cells] < 0
+        cells, boards = cells[new], boards[new]
+        if cells.size == 0:
+            return
+
+        # Rank cells within their board, to append them one after the other
+        order = np.argsort(boards, kind='stable')
+        cells, boards = cells[order], boards[order]
+        first = np.flatnonzero(np.r_[True, boards[1:] != boards[:-1]])
+        counts = np.diff(np.r_[first, boards.size])
+        rank = np.arange(boards.size) - np.repeat(first, counts)
+
+        # Append cells
+        last = self._count[boards] + rank
+        self._cells[boards, last] = cells
+        self._pos[boards, cells] = last
+        self._count[boards[first]] += counts.astype(self._count.dtype)
+
+    def remove(self, cells, boards=0):
+        # Remove a single cell without array overhead
+        if isinstance(cells, int) and isinstance(boards, int):
+            pos = int(self._pos[boards, cells])
+            if pos >= 0:
+                last = int(self._count[boards]) - 1
+                moved = int(self._cells[boards, last])
+                self._cells[boards, pos] = moved
+                self._pos[boards, moved] = pos
+                self._pos[boards, cells] = -1
+                self._count[boards] = last
+            return
+
+        # Keep cells in the index only
+        cells, boards = (a.reshape(-1) for a in np.broadcast_arrays(np.asarray(cells), np.asarray(boards)))
+        pos = self._pos[boards, cells]
+        found = pos >= 0
+        cells, boards, pos = cells[found], boards[found], pos[found]
+
+        # Move last free cell in place of the removed one
+        last = self._count[boards] - 1
+        moved = self._cells[boards, last]
+        self._cells[boards, pos] = moved
+        self._pos[boards, moved] = pos
+        self._pos[boards, cells] = -1
+        self._count[boards] = last
+
+    def sample(self, u, boards=0) -> np.ndarray:
+        """
+        Pick free cells.
+
+        Parameters
+        ----------
+        u : float or np.ndarray
+            Uniform random numbers in [0, 1), one for each board.
+        boards : int or np.ndarray, optional
+            Boards to pick a free cell from. The default is 0.
+
+        Returns
+        -------
+        cells : np.ndarray
+            Picked cells, -1 for boards with no free cell.
+
+        """
+        u, boards = np.broadcast_arrays(np.asarray(u), np.asarray(boards))
+        count = self._count[boards]
+        cells = self._cells[boards, np.minimum((u * count).astype('int64'), np.maximum(count - 1, 0))]
+        return np.where(count > 0, cells, -1)
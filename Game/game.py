@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 import colorsys
 import math
 import numpy as np
@@ -6,11 +6,14 @@ import pygame
 from typing import Sequence, Callable, Union
 
 from Game.environment import Environment
+from Game.executor import PolicyExecutor
+from Game.renderer import FieldRenderer
+from Game.replay import ReplayPlayer, ReplayRecorder
 
 
 class Game:
     def __init__(self, display, size: tuple, game_mode: str = 'field', border: bool = False, snake_speed: float = 1,
-                 block_size: int = 5, max_fps: int = 180):
+                 block_size: int = 5, max_fps: int = 180, render_fps: float = 60, max_queued_commands: int = 3):
         super().__init__()
 
         # Store arguments
@@ -19,6 +22,8 @@ class Game:
         self.block_size = block_size
         self.game_size = size
         self.max_fps = max_fps
+        self.render_fps = render_fps
+        self.max_queued_commands = max_queued_commands
 
         # Init attributes
         self.clock = pygame.time.Clock()
@@ -26,9 +31,10 @@ class Game:
                                        border=border)
         self.game_over = True
         self.closing = False
+        self.profiler = None
 
-        # Set styles
-        self.font_style = pygame.font.SysFont("bahnschrift", 25)
+        # Set styles, loading the font on first use
+        self._font_style = None
         colors = {
             'black': (0, 0, 0),
             'blue': (50, 153, 213),
@@ -42,9 +48,10 @@ class Game:
         }
         self.colors = defaultdict(lambda: (0, 0, 0), **colors)
         self._snake_colors = {}
+        self._renderer = None
 
-        # Set manual game commands ("nesw" for each player)
-        self._received_commands = {k: None for k in range(4)}
+        # Set manual game commands ("nesw" for each player), queued to be applied one per step
+        self._received_commands = {k: deque() for k in range(4)}
         self._manual_commands = {
             pygame.K_UP: (0, 0), pygame.K_RIGHT: (0, 1), pygame.K_DOWN: (0, 2), pygame.K_LEFT: (0, 3),
             pygame.K_w: (1, 0), pygame.K_d: (1, 1), pygame.K_s: (1, 2), pygame.K_a: (1, 3),
@@ -52,6 +59,17 @@ class Game:
             pygame.K_KP8: (3, 0), pygame.K_KP6: (3, 1), pygame.K_KP5: (3, 2), pygame.K_KP4: (3, 3),
         }
 
+    @property
+    def font_style(self):
+        # Load the font on first use, since looking up system fonts is slow
+        if self._font_style is None:
+            self._font_style = pygame.font.SysFont("bahnschrift", 25)
+        return self._font_style
+
+    @font_style.setter
+    def font_style(self, font_style):
+        self._font_style = font_style
+
     @staticmethod
     def __get_distant_colors(n: int, form: str = 'rgb') -> Sequence[Sequence]:
         """
@@ -161,15 +179,31 @@ class Game:
             msg_rect.centery -= msg_rect.height // 2
         self._display.blit(msg, msg_rect)
 
-    def play(self, move_snakes: Sequence[Callable], len_snakes: Union[Sequence[int], int] = 3, **kwargs):
+    def __init_renderer(self, num_snakes: int):
+        # Map colors
+        self._snake_colors = {num: color for num, color in enumerate(self.__get_distant_colors(num_snakes, 'rgb_int'))}
+        colormap = {1: self.colors['white'], -1: self.colors['red']}
+        colormap.update({k+2: v for k, v in self._snake_colors.items()})
+        self._renderer = FieldRenderer(self._display, self.block_size, colormap)
+
+    def play(self, move_snakes: Sequence[Callable], len_snakes: Union[Sequence[int], int] = 3, record: str = None,
+             policy_deadline: float = None, **kwargs):
         # Init attributes
         self.game_over = True
         self.closing = False
-        num_snakes = len(move_snakes)
-        self._snake_colors = {num: color for num, color in enumerate(self.__get_distant_colors(num_snakes, 'rgb_int'))}
-
-        # Predispose time counter
-        tick_time = 0
+        self.__init_renderer(len(move_snakes))
+        self.environment.profiler = self.profiler
+        if self.environment.executor is not None:
+            self.environment.executor.close()
+        self.environment.executor = PolicyExecutor(deadline=policy_deadline) if policy_deadline is not None else None
+        recorder = None
+        num_games = 0
+
+        # Predispose time counters, in milliseconds: steps are due every tick period, frames every frame period
+        tick_time = render_time = 0
+        tick_period = 1000 / self.snake_speed
+        frame_period = 1000 / self.render_fps
+        rendered = True
 
         # Main game loop
         while not self.closing:
@@ -202,13 +236,29 @@ class Game:
                             self.closing = False
                             self.environment.setup(move_snakes=move_snakes, len_snakes=len_snakes, pos_snakes=None,
                                                    **kwargs)
-                            tick_time = pygame.time.get_ticks() - (1 / self.snake_speed * 1000)
+
+                            # Record the game, to a new file for each game
+                            if record is not None:
+                                if recorder is not None:
+                                    recorder.close(self.environment)
+                                recorder = ReplayRecorder(record.format(num_games))
+                                recorder.attach(self.environment)
+                            num_games += 1
+
+                            self._display.fill(self.colors['black'])
+                            pygame.display.update()
+                            self._renderer.invalidate()
+                            for commands in self._received_commands.values():
+                                commands.clear()
+                            tick_time = pygame.time.get_ticks() - tick_period
+                            render_time = tick_time - frame_period
 
             # Play the game
             else:
-                # TODO add no-display mode
-
                 # TODO display scores in real time
+                profiler = self.profiler if self.profiler is not None and self.profiler.enabled else None
+                if profiler is not None:
+                    start = profiler.clock()
 
                 # Get keyboard events
                 for event in pygame.event.get():
@@ -221,55 +271,121 @@ class Game:
                     if event.type == pygame.KEYDOWN:
                         if event.key in self._manual_commands:
                             idx, direction = self._manual_commands[event.key]
-                            if move_snakes[idx] is None:
-                                self._received_commands[idx] = direction
-
-                # Update screen at snakes speed
-                if pygame.time.get_ticks() - tick_time > (1 / self.snake_speed * 1000):
-                    tick_time = pygame.time.get_ticks()
-
-                    # Rotate snakes for manual control
-                    self.environment.send_commands(self._received_commands)
-                    self._received_commands = {k: None for k in self._received_commands.keys()}
-
-                    # Do one game step
-                    self.environment.update()
-
-                    # Check if game has ended
-                    if self.environment.game_over():
-                        self.game_over = True
-
-                    # Update display
-                    self._display.fill(self.colors['black'])
+                            commands = self._received_commands[idx]
+                            if move_snakes[idx] is None and len(commands) < self.max_queued_commands:
+                                commands.append(direction)
+                if profiler is not None:
+                    profiler.add('events', profiler.clock() - start)
+
+                # Do the steps due since last frame, giving up the ones left after a frame period
+                now = pygame.time.get_ticks()
+                while not self.game_over and now - tick_time >= tick_period:
+                    self.__step()
+                    rendered = False
+                    tick_time += tick_period
+                    if pygame.time.get_ticks() - now >= frame_period:
+                        tick_time = max(tick_time, pygame.time.get_ticks() - tick_period)
+                        break
+
+                # Draw the last step at render speed, skipping frames in between
+                now = pygame.time.get_ticks()
+                if not rendered and (self.game_over or now - render_time >= frame_period):
+                    render_time = now
+                    rendered = True
+                    if profiler is not None:
+                        start = profiler.clock()
                     self.__update_display()
+                    if profiler is not None:
+                        profiler.add('render', profiler.clock() - start)
 
                 # Wait clock
                 self.clock.tick(self.max_fps)
 
         # Quit the game
+        if recorder is not None:
+            recorder.close(self.environment)
+        if self.environment.executor is not None:
+            self.environment.executor.close()
+            self.environment.executor = None
         pygame.quit()
 
+    def __step(self):
+        # Rotate snakes for manual control, one queued command per player and step
+        self.environment.send_commands({k: commands.popleft() if commands else None
+                                        for k, commands in self._received_commands.items()})
+
+        # Do one game step, and check if game has ended
+        self.environment.update()
+        if self.environment.game_over():
+            self.game_over = True
+
     def __update_display(self):
-        # Get current game field
-        game_field = self.environment.game_field
+        # Draw cells changed since last update
+        self._renderer.draw(self.environment.game_field)
 
-        # Set threshold to add a 1 pixel border
-        th = 5
+    def replay(self, player: ReplayPlayer, snake_speed: float = None):
+        """
+        Show a recorded game.
 
-        # Map colors
-        colormap = {1: self.colors['white'], -1: self.colors['red']}
-        colormap.update({k+2: v for k, v in self._snake_colors.items()})
+        Keys: SPACE pause, LEFT/RIGHT one step back/forward, PAGE UP/PAGE DOWN 100 steps back/forward, HOME restart,
+        +/- double/halve speed, Q quit.
 
-        # Update display accordingly
-        for y, x in zip(*np.where(game_field)):
-            label = game_field[y, x]
-            if label not in colormap:
-                continue
-            pygame.draw.rect(self._display, colormap[label],
-                             [x * self.block_size + (self.block_size > th),
-                              y * self.block_size + (self.block_size > th),
-                              self.block_size - (self.block_size > th) * 2,
-                              self.block_size - (self.block_size > th) * 2])
-
-        # Update display
+        Parameters
+        ----------
+        player : ReplayPlayer
+            Recorded game to show.
+        snake_speed : float, optional
+            Steps per second, any positive value. The default is the speed of the game.
+
+        """
+        # Init attributes
+        self.closing = False
+        self.environment = player.environment
+        self.__init_renderer(player.num_snakes)
+        snake_speed = max(snake_speed or self.snake_speed, 0.1)
+        paused = False
+        seeks = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_PAGEUP: -100, pygame.K_PAGEDOWN: 100}
+
+        # Draw first step
+        self._display.fill(self.colors['black'])
         pygame.display.update()
+        self.__update_display()
+        tick_time = pygame.time.get_ticks()
+
+        # Main replay loop
+        while not self.closing:
+            # Get keyboard events
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.closing = True
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_q or event.key == pygame.K_ESCAPE:
+                        self.closing = True
+                    elif event.key == pygame.K_SPACE:
+                        paused = not paused
+                    elif event.key in seeks:
+                        player.seek(player.tick + seeks[event.key])
+                        self.__update_display()
+                    elif event.key == pygame.K_HOME:
+                        player.seek(0)
+                        self.__update_display()
+                    elif event.key in (pygame.K_PLUS, pygame.K_KP_PLUS, pygame.K_EQUALS):
+                        snake_speed *= 2
+                    elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                        snake_speed = max(snake_speed / 2, 0.1)
+
+            # Play as many steps as elapsed at the replay speed, drawing only the last one
+            elapsed = pygame.time.get_ticks() - tick_time
+            if paused or player.tick >= player.num_ticks:
+                tick_time = pygame.time.get_ticks()
+            elif elapsed > 1000 / snake_speed:
+                steps = int(elapsed * snake_speed / 1000)
+                tick_time += steps * 1000 / snake_speed
+                player.seek(player.tick + steps)
+                self.__update_display()
+
+            # Wait clock
+            self.clock.tick(self.max_fps)
+
+        # Quit the game
+        pygame.quit()
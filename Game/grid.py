@@ -0,0 +1,242 @@
+import copy
+import numpy as np
+from typing import Iterable, Tuple, Union
+
+from Game.free_cells import FreeCells
+
+
+class Grid:
+    """
+    Labelled game field, updated in place as snakes move.
+
+    Each cell holds the same label used by `Environment.game_field`: 0 for empty cells, -1 for food, 1 for walls and
+    corpses, and the snake number for cells occupied by a living snake. A second, clipped copy of the labels is kept
+    in sync to be handed to move methods. Both are exposed as read-only views, so reading them costs nothing. Cells
+    with no wall, corpse or snake are tracked in a `FreeCells` index, to place food in constant time.
+
+    The clipped labels are surrounded by a halo, holding either the cells on the opposite side of the field (when
+    wrapping around) or walls. Windows around any cell are thus plain slices of the padded matrix, and do not depend
+    on the field size.
+
+    Parameters
+    ----------
+    walls : np.ndarray
+        Boolean matrix of shape (height, width), True where a wall is.
+    clip : int, optional
+        Maximum label visible to move methods, or None to show snake numbers. The default is None.
+    halo : int, optional
+        Size of the halo around the clipped labels. The default is 0.
+    wrap : bool, optional
+        If True the halo wraps around the field, otherwise it is made of walls. The default is True.
+    dtype : str, optional
+        Type of the labels, large enough for all snake numbers. The default is 'int8'.
+
+    """
+
+    def __init__(self, walls: np.ndarray, clip: Union[int, None] = None, halo: int = 0, wrap: bool = True,
+                 dtype: str = 'int8'):
+        super().__init__()
+
+        # Init attributes
+        self._clip = clip
+        self._halo = halo
+        self._wrap = wrap
+        self._food: Union[Tuple[int, int], None] = None
+        self._version = 0
+        height, width = walls.shape
+
+        # Init labels: background holds walls and corpses
+        self._background = walls.astype(dtype)
+        self._labels = self._background.copy()
+        self._padded = np.zeros((height + 2*halo, width + 2*halo), dtype=dtype)
+        self.__init_views()
+        self.__pad()
+        self._free = FreeCells(self._labels.reshape(-1) <= 0)
+
+    def __init_views(self):
+        # Init views of the padded labels, and read-only views
+        halo = self._halo
+        height, width = self._labels.shape
+        self._observation = self._padded[halo:halo + height, halo:halo + width]
+        self._labels_view = self._labels.view()
+        self._labels_view.flags.writeable = False
+        self._padded_view = self._padded.view()
+        self._padded_view.flags.writeable = False
+        self._observation_view = self._padded_view[halo:halo + height, halo:halo + width]
+
+    def __deepcopy__(self, memo: dict) -> 'Grid':
+        # Copy arrays, then build views on the copies
+        grid = Grid.__new__(Grid)
+        grid.__dict__.update(copy.deepcopy({k: v for k, v in self.__dict__.items() if not k.endswith('_view')
+                                            and k != '_observation'}, memo))
+        grid.__init_views()
+        return grid
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._labels_view
+
+    @property
+    def observation(self) -> np.ndarray:
+        return self._observation_view
+
+    @property
+    def padded_observation(self) -> np.ndarray:
+        return self._padded_view
+
+    @property
+    def halo(self) -> int:
+        return self._halo
+
+    @property
+    def version(self) -> int:
+        # Number of changes of labels so far, to know when values computed from them are outdated
+        return self._version
+
+    @property
+    def num_free(self) -> int:
+        return int(self._free.count[0])
+
+    @property
+    def food(self) -> Union[Tuple[int, int], None]:
+        return self._food
+
+    @food.setter
+    def food(self, food: Union[Tuple[int, int], None]):
+        # Set the food position, without drawing it
+        self._food = food
+
+    @property
+    def arrays(self) -> tuple:
+        # Get the arrays holding the state of the grid, to be saved or overwritten in place
+        return (self._background, self._labels, self._padded) + self._free.arrays
+
+    def load(self, buffer: np.ndarray, offset: int = 0) -> int:
+        # Copy the state arrays in place from a buffer of bytes, as packed after `arrays`, returning the end offset
+        for values in self.arrays:
+            values.reshape(-1).view('uint8')[:] = buffer[offset:offset + values.nbytes]
+            offset += values.nbytes
+        self._version += 1
+        return offset
+
+    def get(self, x: int, y: int) -> int:
+        return int(self._labels[y, x])
+
+    def get_cells(self, cells: np.ndarray) -> np.ndarray:
+        # Get labels of many cells, given as (x, y) rows
+        cells = np.asarray(cells).reshape(-1, 2)
+        return self._labels[cells[:, 1], cells[:, 0]]
+
+    def set(self, x: int, y: int, label: int):
+        # Update free cells index
+        if (self._labels[y, x] > 0) != (label > 0):
+            if label > 0:
+                self._free.remove(y * self._labels.shape[1] + x)
+            else:
+                self._free.add(y * self._labels.shape[1] + x)
+
+        # Update label of a cell
+        self._labels[y, x] = label
+        self._version += 1
+
+        # Update clipped label of the cell, and its copies in the halo
+        label = max(label, 0)
+        label = label if self._clip is None else min(label, self._clip)
+        if self._wrap and self._halo:
+            height, width = self._labels.shape
+            for yy in range((y + self._halo) % height, height + 2*self._halo, height):
+                for xx in range((x + self._halo) % width, width + 2*self._halo, width):
+                    self._padded[yy, xx] = label
+        else:
+            self._observation[y, x] = label
+
+    def clear(self, x: int, y: int):
+        # Restore background (or food) of a cell
+        label = int(self._background[y, x])
+        self.set(x, y, -1 if label == 0 and (x, y) == self._food else label)
+
+    def add_wall(self, x: int, y: int):
+        # Add a wall (e.g. a corpse) to the background of a cell, without drawing it
+        self._background[y, x] = 1
+
+    def __pad(self):
+        # Draw clipped labels and the halo around them
+        observation = np.clip(self._labels, 0, self._clip)
+        if self._wrap:
+            self._padded[:] = np.pad(observation, self._halo, mode='wrap')
+        else:
+            self._padded[:] = np.pad(observation, self._halo, mode='constant', constant_values=1)
+
+    def window(self, x: int, y: int, half_height: int, half_width: int) -> np.ndarray:
+        # Get a view of clipped labels around a cell, which may be up to `halo` cells out of the field
+        x, y = x + self._halo, y + self._halo
+        return self._padded_view[y - half_height:y + half_height + 1, x - half_width:x + half_width + 1]
+
+    def windows(self, cells: np.ndarray, half_size: int) -> np.ndarray:
+        """
+        Get clipped labels around many cells at once.
+
+        Parameters
+        ----------
+        cells : np.ndarray
+            Positions (x, y) of the cells, with shape (n, 2).
+        half_size : int
+            Number of cells to include in each direction, up to `halo`.
+
+        Returns
+        -------
+        windows : np.ndarray
+            Clipped labels around each cell, with shape (n, 2 * half_size + 1, 2 * half_size + 1).
+
+        """
+        size = 2 * half_size + 1
+        windows = np.lib.stride_tricks.sliding_window_view(self._padded_view, (size, size))
+        cells = np.asarray(cells).reshape(-1, 2) + (self._halo - half_size)
+        return windows[cells[:, 1], cells[:, 0]]
+
+    def sample_free(self, u: float) -> Union[Tuple[int, int], None]:
+        # Pick a free cell given a uniform random number, if any
+        cell = int(self._free.sample(u))
+        if cell < 0:
+            return None
+        return cell % self._labels.shape[1], cell // self._labels.shape[1]
+
+    def move_food(self, x: int, y: int):
+        # Remove old food, unless something else is on top of it
+        old, self._food = self._food, (x, y)
+        if old is not None and self.get(*old) == -1:
+            self.clear(*old)
+
+        # Put new food
+        if self.get(x, y) == 0:
+            self.set(x, y, -1)
+
+    def redraw(self, snakes: Iterable[Tuple[int, np.ndarray]], corpses: Iterable[np.ndarray] = ()):
+        """
+        Draw the whole field from scratch.
+
+        Parameters
+        ----------
+        snakes : Iterable[Tuple[int, np.ndarray]]
+            Label and body (as (x, y) rows) of each snake to draw, in drawing order.
+        corpses : Iterable[np.ndarray]
+            Bodies to add to the background.
+
+        """
+        # Add corpses to background
+        for body in corpses:
+            body = np.asarray(body).reshape(-1, 2)
+            self._background[body[:, 1], body[:, 0]] = 1
+
+        # Draw background and food
+        self._labels[:] = self._background
+        if self._food is not None and self._labels[self._food[1], self._food[0]] == 0:
+            self._labels[self._food[1], self._food[0]] = -1
+
+        # Draw snakes
+        for label, body in snakes:
+            body = np.asarray(body).reshape(-1, 2)
+            self._labels[body[:, 1], body[:, 0]] = label
+        self.__pad()
+        self._free.reset(self._labels.reshape(-1) <= 0)
+        self._version += 1
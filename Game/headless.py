@@ -0,0 +1,86 @@
+import numpy as np
+from typing import Union, Callable, Sequence, Dict
+
+from Game.environment import Environment
+
+
+def run_episode(move_snakes: Sequence[Callable], len_snakes: Union[Sequence[int], int] = 3, max_steps: int = 1000,
+                game_mode: str = 'field', width: int = 10, height: int = 10, border: bool = False, seed: int = None,
+                environment: Environment = None, **kwargs) -> Dict[str, Union[list, int]]:
+    """
+    Play one game without display, as fast as possible.
+
+    Parameters
+    ----------
+    move_snakes : Sequence[Callable]
+        Moving method of each snake, None for snakes that go straight.
+    len_snakes : Sequence[int] or int, optional
+        Initial length of each snake. The default is 3.
+    max_steps : int, optional
+        Maximum number of steps to play, None to play until all snakes are dead. The default is 1000.
+    game_mode : str, optional
+        Game mode, see `game_rules.GameModes`. The default is 'field'.
+    width : int, optional
+        Width of the game field. The default is 10.
+    height : int, optional
+        Height of the game field. The default is 10.
+    border : bool, optional
+        If True use borders, otherwise use teleportation. The default is False.
+    seed : int, optional
+        Seed of the environment random generator. The default is None.
+    environment : Environment, optional
+        Environment to play in, to reuse it across games. If given, game mode, field size and seed are ignored.
+    **kwargs
+        Further game rules, passed to `Environment.setup`.
+
+    Returns
+    -------
+    result : Dict[str, Union[list, int]]
+        Final 'scores', 'lengths' and 'alive' state of each snake, and number of 'steps' played.
+
+    """
+    # Prepare environment
+    if environment is None:
+        environment = Environment(game_mode=game_mode, width=width, height=height, border=border, seed=seed)
+    environment.setup(move_snakes=move_snakes, len_snakes=len_snakes, **kwargs)
+
+    # Play until game over
+    steps = 0
+    while not environment.game_over() and (max_steps is None or steps < max_steps):
+        environment.update()
+        steps += 1
+
+    return {
+        'scores': environment.get_scores(),
+        'lengths': environment.get_lengths(),
+        'alive': environment.get_alive(),
+        'steps': steps,
+    }
+
+
+def run_episodes(n: int, move_snakes: Sequence[Callable], len_snakes: Union[Sequence[int], int] = 3,
+                 max_steps: int = 1000, game_mode: str = 'field', width: int = 10, height: int = 10,
+                 border: bool = False, seed: int = None, **kwargs) -> Dict[str, np.ndarray]:
+    """
+    Play many games without display, as fast as possible.
+
+    Parameters are the same as `run_episode`, plus the number of games `n` to play.
+
+    Returns
+    -------
+    results : Dict[str, np.ndarray]
+        Final 'scores', 'lengths' and 'alive' state with shape (n, snakes), and 'steps' with shape (n,).
+
+    """
+    # Play all games in the same environment
+    environment = Environment(game_mode=game_mode, width=width, height=height, border=border, seed=seed)
+    results = [run_episode(move_snakes, len_snakes, max_steps, environment=environment, **kwargs) for _ in range(n)]
+
+    # Stack results
+    num_snakes = len(move_snakes)
+    return {
+        'scores': np.array([r['scores'] for r in results], dtype='int64').reshape(n, num_snakes),
+        'lengths': np.array([r['lengths'] for r in results], dtype='int64').reshape(n, num_snakes),
+        'alive': np.array([r['alive'] for r in results], dtype=bool).reshape(n, num_snakes),
+        'steps': np.array([r['steps'] for r in results], dtype='int64').reshape(n),
+    }
@@ -0,0 +1,284 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import traceback
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import game_rules
+from Game.codec import ObservationCodec
+from Game.environment import Environment
+
+# Action letting the moving method of a snake choose its move
+NO_ACTION = -128
+
+# Commands sent to workers
+_STEP, _RESET, _CLOSE, _DONE, _ERROR = b's', b'r', b'c', b'd', b'e'
+
+
+def _layout(num_envs: int, num_snakes: int, shape: Tuple[int, int], packed: Tuple[int, int],
+            dtype: str) -> Tuple[Dict[str, tuple], int]:
+    # Get shape, type and offset of each shared array, aligned to 64 bytes
+    arrays = {
+        'fields': ((num_envs,) + tuple(shape), dtype),
+        'observations': ((num_envs, num_snakes) + tuple(packed), 'uint8'),
+        'actions': ((num_envs, num_snakes), 'int8'),
+        'rewards': ((num_envs, num_snakes), 'int32'),
+        'scores': ((num_envs, num_snakes), 'int32'),
+        'alive': ((num_envs, num_snakes), 'bool'),
+        'done': ((num_envs,), 'bool'),
+        'steps': ((num_envs,), 'int64'),
+        'resets': ((num_envs,), 'bool'),
+    }
+    layout, offset = {}, 0
+    for name, (shape, dtype) in arrays.items():
+        layout[name] = (shape, dtype, offset)
+        offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64
+    return layout, max(offset, 1)
+
+
+def _views(buffer, layout: Dict[str, tuple]) -> Dict[str, np.ndarray]:
+    # Get arrays laid out in a shared buffer
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for name, (shape, dtype, offset) in layout.items()}
+
+
+def _worker(conn, name: str, layout: Dict[str, tuple], first: int, seeds: Sequence[np.random.SeedSequence],
+            env_kwargs: dict, setup_kwargs: dict, max_steps: Union[int, None], auto_reset: bool):
+    # Attach to the shared block, and view the slice of this worker
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {name: array[first:first + len(seeds)] for name, array in _views(block.buf, layout).items()}
+    environments = [Environment(seed=seed, **env_kwargs) for seed in seeds]
+    players = range(arrays['actions'].shape[1])
+
+    def publish(ii: int, env: Environment):
+        # Write state and observations of an environment
+        arrays['fields'][ii] = env.game_field
+        arrays['scores'][ii] = env.get_scores()
+        arrays['alive'][ii] = env.get_alive()
+        for player in players:
+            env.encode_observation(player, out=arrays['observations'][ii, player])
+
+    def reset(ii: int, env: Environment):
+        # Start a new game
+        env.setup(**setup_kwargs)
+        arrays['steps'][ii] = 0
+        arrays['actions'][ii] = NO_ACTION
+        publish(ii, env)
+
+    try:
+        while True:
+            command = conn.recv_bytes()
+            if command == _CLOSE:
+                break
+
+            for ii, env in enumerate(environments):
+                # Start new games where required
+                if command == _RESET:
+                    if arrays['resets'][ii]:
+                        arrays['rewards'][ii] = 0
+                        arrays['done'][ii] = False
+                        reset(ii, env)
+                    continue
+
+                # Do one game step, with the actions given by the learner
+                if arrays['done'][ii] and not auto_reset:
+                    arrays['rewards'][ii] = 0
+                    continue
+                actions = arrays['actions'][ii]
+                scores = arrays['scores'][ii].copy()
+                env.update({player: int(actions[player]) for player in players if actions[player] != NO_ACTION})
+                arrays['steps'][ii] += 1
+                publish(ii, env)
+                arrays['rewards'][ii] = arrays['scores'][ii] - scores
+                arrays['done'][ii] = env.game_over() or (max_steps is not None and arrays['steps'][ii] >= max_steps)
+
+                # Start a new game in place, keeping rewards and done flag of the last step
+                if arrays['done'][ii] and auto_reset:
+                    reset(ii, env)
+
+            conn.send_bytes(_DONE)
+    except Exception:
+        conn.send_bytes(_ERROR + traceback.format_exc().encode())
+    finally:
+        # Release views of the shared block, so that it can be closed
+        arrays.clear()
+        block.close()
+
+
+class EnvironmentPool:
+    """
+    Environments stepped by worker processes, exchanging all data through shared memory.
+
+    Fields, bit-packed observations, actions, rewards, scores, alive and done flags of all environments live in
+    preallocated arrays of one `multiprocessing.shared_memory` block, and each worker owns a contiguous slice of
+    environments. The learner reads and writes these arrays in place: each step only sends a one byte command to
+    each worker and waits for a one byte answer, so nothing is pickled or copied.
+
+    Actions are moves (-1 turn left, 0 go straight, 1 turn right), or NO_ACTION to let the moving method of the snake
+    choose, and are reset to NO_ACTION at the start of each game. Rewards are the score gained in the last step.
+    Observations are encoded by `codec`, one per snake, see `Environment.encode_observation`.
+
+    A game is done when all snakes are dead or after `max_steps` steps. Finished games are reset in place by their
+    worker: rewards and done flags still refer to the last step of the finished game, while fields, observations and
+    scores already show the new one.
+
+    Parameters
+    ----------
+    num_envs : int
+        Number of environments.
+    move_snakes : Sequence[Callable]
+        Moving method of each snake, None for snakes only driven by actions. Methods must be picklable.
+    num_workers : int, optional
+        Number of worker processes, None to use all cores. The default is None.
+    max_steps : int, optional
+        Maximum number of steps of a game, None to play until all snakes are dead. The default is 1000.
+    auto_reset : bool, optional
+        If True finished games are reset in place, otherwise they stay done until `reset`. The default is True.
+    game_mode, width, height, border, field_backend
+        Arguments of each `Environment`.
+    seed : int, optional
+        Seed of the pool, each environment gets its own seed from it. The default is None.
+    start_method : str, optional
+        Start method of worker processes, see `multiprocessing.get_context`. The default is the platform default.
+    **kwargs
+        Further game rules, passed to `Environment.setup`.
+
+    """
+
+    def __init__(self, num_envs: int, move_snakes: Sequence[Callable], num_workers: int = None,
+                 max_steps: Union[int, None] = 1000, auto_reset: bool = True, game_mode: str = 'field',
+                 width: int = 10, height: int = 10, border: bool = False, seed: int = None,
+                 field_backend: str = game_rules.FieldBackends.dense, start_method: str = None, **kwargs):
+        super().__init__()
+
+        # Store arguments
+        assert num_envs > 0, f"Invalid number of environments {num_envs}."
+        self.num_envs = num_envs
+        self.num_snakes = len(move_snakes)
+        self.codec = ObservationCodec((height, width))
+
+        # Allocate shared arrays
+        dtype = 'int8' if self.num_snakes + 2 <= np.iinfo('int8').max else 'int16'
+        packed = (len(self.codec.channels), self.codec.channel_bytes)
+        layout, size = _layout(num_envs, self.num_snakes, (height, width), packed, dtype)
+        self._block = shared_memory.SharedMemory(create=True, size=size)
+        self._arrays = _views(self._block.buf, layout)
+
+        # Start workers, each with a contiguous slice of environments
+        num_workers = min(num_workers or multiprocessing.cpu_count(), num_envs)
+        context = multiprocessing.get_context(start_method)
+        seeds = np.random.SeedSequence(seed).spawn(num_envs)
+        env_kwargs = {'game_mode': game_mode, 'width': width, 'height': height, 'border': border,
+                      'field_backend': field_backend}
+        setup_kwargs = dict(kwargs, move_snakes=tuple(move_snakes))
+        self._connections: List = []
+        self._workers: List = []
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype('int64')
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            conn, worker_conn = context.Pipe()
+            worker = context.Process(target=_worker, daemon=True,
+                                     args=(worker_conn, self._block.name, layout, int(first), seeds[first:last],
+                                           env_kwargs, setup_kwargs, max_steps, auto_reset))
+            worker.start()
+            self._connections.append(conn)
+            self._workers.append(worker)
+        self.reset()
+
+    @property
+    def fields(self) -> np.ndarray:
+        # Labels of each field, as in `Environment.game_field`
+        return self._arrays['fields']
+
+    @property
+    def observations(self) -> np.ndarray:
+        # Bit-packed observation of each snake, decoded by `codec`
+        return self._arrays['observations']
+
+    @property
+    def actions(self) -> np.ndarray:
+        # Action of each snake for the next step
+        return self._arrays['actions']
+
+    @property
+    def rewards(self) -> np.ndarray:
+        # Score gained by each snake in the last step
+        return self._arrays['rewards']
+
+    @property
+    def scores(self) -> np.ndarray:
+        # Score of each snake
+        return self._arrays['scores']
+
+    @property
+    def alive(self) -> np.ndarray:
+        # Alive flag of each snake
+        return self._arrays['alive']
+
+    @property
+    def done(self) -> np.ndarray:
+        # Done flag of each environment, for the last step
+        return self._arrays['done']
+
+    @property
+    def steps(self) -> np.ndarray:
+        # Steps played in the current game of each environment
+        return self._arrays['steps']
+
+    def __enter__(self) -> 'EnvironmentPool':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __send(self, command: bytes):
+        # Send a command to all workers
+        for conn in self._connections:
+            conn.send_bytes(command)
+
+    def wait(self):
+        # Wait until all workers are done with the last command
+        for conn in self._connections:
+            answer = conn.recv_bytes()
+            if answer[:1] == _ERROR:
+                raise RuntimeError(f"Environment worker failed:\n{answer[1:].decode()}")
+
+    def reset(self, mask: np.ndarray = None):
+        """
+        Start new games.
+
+        Parameters
+        ----------
+        mask : np.ndarray, optional
+            Boolean array, True for the environments to reset. The default is all of them.
+
+        """
+        self._arrays['resets'][:] = True if mask is None else mask
+        self.__send(_RESET)
+        self.wait()
+
+    def step_async(self, actions: np.ndarray = None):
+        # Start one step of all environments, with the given actions or those already written in `actions`
+        if actions is not None:
+            self._arrays['actions'][:] = actions
+        self.__send(_STEP)
+
+    def step(self, actions: np.ndarray = None):
+        # Do one step of all environments, then results are in the shared arrays
+        self.step_async(actions)
+        self.wait()
+
+    def close(self):
+        # Stop workers and free the shared block
+        if self._block is None:
+            return
+        for conn in self._connections:
+            try:
+                conn.send_bytes(_CLOSE)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join()
+        self._arrays = {}
+        self._block.close()
+        self._block.unlink()
+        self._block = None
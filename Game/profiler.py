@@ -0,0 +1,159 @@
+import json
+import numpy as np
+import time
+from typing import Callable, Dict, List, TextIO, Union
+
+# Upper edges of latency histogram bins, in microseconds
+HISTOGRAM_EDGES = tuple(2 ** k for k in range(21))
+
+
+def policy_name(method: Callable) -> str:
+    # Get a readable name of a moving method
+    if method is None:
+        return 'straight'
+    return getattr(method, '__qualname__', None) or getattr(method, '__name__', None) or type(method).__name__
+
+
+class LatencySeries:
+    """
+    Latencies of a phase, keeping the last ones in a ring buffer.
+
+    Parameters
+    ----------
+    window : int
+        Number of latencies kept for percentiles and histograms.
+
+    """
+
+    __slots__ = ('window', 'count', 'total', '_values')
+
+    def __init__(self, window: int):
+        super().__init__()
+
+        self.window = window
+        self.count = 0
+        self.total = 0
+        self._values: List[int] = []
+
+    def add(self, ns: int):
+        # Store a latency in nanoseconds, overwriting the oldest one when the window is full
+        if len(self._values) < self.window:
+            self._values.append(ns)
+        else:
+            self._values[self.count % self.window] = ns
+        self.count += 1
+        self.total += ns
+
+    def summary(self) -> Dict[str, Union[int, float, list]]:
+        # Get count and total of all latencies, percentiles and histogram of the last ones, in microseconds
+        values = np.asarray(self._values, dtype='float64') / 1000
+        summary = {'count': self.count, 'total_ms': self.total / 1e6}
+        if values.size:
+            summary.update({
+                'mean_us': float(values.mean()),
+                'p50_us': float(np.percentile(values, 50)),
+                'p99_us': float(np.percentile(values, 99)),
+                'max_us': float(values.max()),
+                'histogram': np.bincount(np.searchsorted(HISTOGRAM_EDGES, values),
+                                         minlength=len(HISTOGRAM_EDGES) + 1).tolist(),
+            })
+        return summary
+
+
+class Profiler:
+    """
+    Timers and counters for the phases of game steps.
+
+    Attach a profiler to `Environment.profiler` to time each phase of `Environment.update`: batched moving methods,
+    single moving methods (by player and by policy), direction changes, collision checks, field redraws, the rest of
+    the game rules ('step') and food placement. These phases do not overlap, so they add up to the whole tick.
+    Attach it to `Game.profiler` to also time event polling and rendering in `Game.play`. Latencies are kept as
+    rolling series, from which percentiles and histograms of the last `window` values are computed on request.
+
+    Timers are only read when a profiler is attached and enabled, otherwise each phase costs a single check.
+
+    Parameters
+    ----------
+    window : int, optional
+        Number of latencies kept for each phase. The default is 1024.
+    enabled : bool, optional
+        If False nothing is timed until enabled. The default is True.
+
+    """
+
+    # Clock used by all timers, in nanoseconds
+    clock = staticmethod(time.perf_counter_ns)
+
+    def __init__(self, window: int = 1024, enabled: bool = True):
+        super().__init__()
+
+        # Store arguments
+        self.window = window
+        self.enabled = enabled
+
+        # Init series and counters
+        self.phases: Dict[str, LatencySeries] = {}
+        self.players: Dict[int, LatencySeries] = {}
+        self.policies: Dict[str, LatencySeries] = {}
+        self.counters: Dict[str, int] = {}
+
+        # Init time of the phases nested in the current game step
+        self.nested = 0
+
+    def reset(self):
+        # Drop all series and counters
+        self.phases, self.players, self.policies, self.counters = {}, {}, {}, {}
+        self.nested = 0
+
+    def add(self, phase: str, ns: int, nested: bool = False):
+        # Store the latency of a phase, also counting it in the time nested in the game step if required
+        if nested:
+            self.nested += ns
+        series = self.phases.get(phase, None)
+        if series is None:
+            series = self.phases[phase] = LatencySeries(self.window)
+        series.add(ns)
+
+    def add_move(self, player: int, method: Callable, ns: int):
+        # Store the latency of a moving method, by player and by policy
+        self.add('move', ns, nested=True)
+        series = self.players.get(player, None)
+        if series is None:
+            series = self.players[player] = LatencySeries(self.window)
+        series.add(ns)
+        self.add_policy(method, ns)
+
+    def add_policy(self, method: Callable, ns: int):
+        # Store the latency of a call of a moving method, e.g. a batched one for many snakes
+        name = policy_name(method)
+        series = self.policies.get(name, None)
+        if series is None:
+            series = self.policies[name] = LatencySeries(self.window)
+        series.add(ns)
+
+    def count(self, counter: str, n: int = 1):
+        # Increase a counter
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Get the current statistics.
+
+        Returns
+        -------
+        snapshot : Dict[str, dict]
+            Summary of each phase, player and policy series, with count, total time, mean, p50, p99 and max latency
+            and histogram (with upper bin edges HISTOGRAM_EDGES, in microseconds), and counters.
+
+        """
+        return {
+            'time': time.time(),
+            'phases': {name: series.summary() for name, series in self.phases.items()},
+            'players': {str(player): series.summary() for player, series in self.players.items()},
+            'policies': {name: series.summary() for name, series in self.policies.items()},
+            'counters': dict(self.counters),
+        }
+
+    def write(self, file: TextIO):
+        # Append a snapshot to a JSON lines file
+        file.write(json.dumps(self.snapshot()) + '\n')
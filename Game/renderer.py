@@ -0,0 +1,130 @@
+import numpy as np
+import pygame
+from typing import Dict, Tuple, Union
+
+
+class FieldRenderer:
+    """
+    Draw game fields on a display, redrawing only what changed.
+
+    The last drawn field is kept, and only cells whose label changed are drawn again and passed to
+    `pygame.display.update`. When most of the field changed, the whole field is instead drawn at once through
+    `pygame.surfarray` with a color lookup table.
+
+    Parameters
+    ----------
+    display : pygame.Surface
+        Surface to draw on, with the field in its top left corner.
+    block_size : int
+        Size in pixels of each cell.
+    colormap : Dict[int, tuple]
+        Color of each label. Cells with other labels are black.
+    bulk_fraction : float, optional
+        Fraction of changed cells above which the whole field is drawn at once. The default is 0.25.
+
+    """
+
+    # Block size above which a 1 pixel border is left around cells
+    border_threshold: int = 5
+
+    def __init__(self, display, block_size: int, colormap: Dict[int, tuple], bulk_fraction: float = 0.25):
+        super().__init__()
+
+        # Store arguments
+        self._display = display
+        self.block_size = block_size
+        self.bulk_fraction = bulk_fraction
+
+        # Init color lookup table from the lowest to the highest label, plus a last black entry for other labels
+        self._lut_offset = -min(min(colormap, default=0), 0)
+        self._lut = np.zeros((max(max(colormap, default=0), 0) + self._lut_offset + 2, 3), dtype='uint8')
+        for label, color in colormap.items():
+            self._lut[label + self._lut_offset] = color[:3]
+        self._colored = self._lut.any(axis=1)
+
+        # Init mask of the drawn pixels of a block
+        margin = int(block_size > self.border_threshold)
+        self._block_mask = np.zeros((block_size, block_size), dtype=bool)
+        self._block_mask[margin:block_size - margin, margin:block_size - margin] = True
+
+        # Init last drawn field
+        self._last_field: Union[np.ndarray, None] = None
+        self._surface = None
+
+    def invalidate(self):
+        # Force a full redraw at next draw
+        self._last_field = None
+
+    def __lut_index(self, labels: np.ndarray) -> np.ndarray:
+        # Get the rows of the color lookup table of some labels
+        index = labels.astype('int64') + self._lut_offset
+        return np.where((index >= 0) & (index < len(self._lut)), index, len(self._lut) - 1)
+
+    def draw(self, game_field: np.ndarray) -> Tuple[int, bool]:
+        """
+        Draw a game field, updating the display.
+
+        Parameters
+        ----------
+        game_field : np.ndarray
+            Labels of the field, as in `Environment.game_field`.
+
+        Returns
+        -------
+        changed : int
+            Number of cells drawn again.
+        bulk : bool
+            True if the whole field was drawn at once.
+
+        """
+        # Find changed cells
+        if self._last_field is None or self._last_field.shape != game_field.shape:
+            changed = game_field.size
+            ys = xs = None
+            self._last_field = np.empty_like(game_field)
+        else:
+            ys, xs = np.nonzero(game_field != self._last_field)
+            changed = ys.size
+        np.copyto(self._last_field, game_field)
+
+        # Draw the whole field, or only changed cells
+        if changed == 0:
+            return 0, False
+        if ys is None or changed > self.bulk_fraction * game_field.size:
+            self.__draw_bulk(game_field)
+            return changed, True
+        self.__draw_cells(game_field, ys, xs)
+        return changed, False
+
+    def __draw_cells(self, game_field: np.ndarray, ys: np.ndarray, xs: np.ndarray):
+        # Draw each changed cell, keeping track of the dirty rectangles
+        size = self.block_size
+        margin = int(size > self.border_threshold)
+        rects = []
+        for y, x, index in zip(ys.tolist(), xs.tolist(), self.__lut_index(game_field[ys, xs]).tolist()):
+            rect = pygame.Rect(x * size, y * size, size, size)
+            self._display.fill((0, 0, 0), rect)
+            if self._colored[index]:
+                pygame.draw.rect(self._display, self._lut[index].tolist(),
+                                 [x * size + margin, y * size + margin, size - margin * 2, size - margin * 2])
+            rects.append(rect)
+
+        # Update display
+        pygame.display.update(rects)
+
+    def __draw_bulk(self, game_field: np.ndarray):
+        # Map labels to colors, and expand each cell to a block of pixels
+        height, width = game_field.shape
+        size = self.block_size
+        colors = self._lut[self.__lut_index(game_field)]
+        pixels = colors.repeat(size, axis=0).repeat(size, axis=1)
+        pixels *= np.tile(self._block_mask, (height, width))[:, :, None]
+
+        # Blit the field through a surface of the same size
+        if self._surface is None or self._surface.get_size() != (width * size, height * size):
+            self._surface = pygame.Surface((width * size, height * size))
+        pygame.surfarray.blit_array(self._surface, pixels.transpose(1, 0, 2))
+        self._display.blit(self._surface, (0, 0))
+
+        # Update display
+        pygame.display.update(self._surface.get_rect())
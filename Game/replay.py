@@ -0,0 +1,230 @@
+import json
+import numpy as np
+import struct
+from typing import Dict, Union
+
+from Game.environment import Environment
+
+# File layout: magic, version and header length, then JSON header, chunks and chunk index
+MAGIC = b'SNAKEREP'
+VERSION = 1
+_PREFIX = struct.Struct('<8sII')
+_FOOTER = struct.Struct('<QQ8s')
+_STATE_FIELDS = (
+    ('food', 'int16'), ('directions', 'int8'), ('lengths', 'int32'), ('scores', 'int32'), ('alive', 'bool'),
+    ('body_lengths', 'int32'), ('bodies', 'int16'),
+)
+
+
+def pack_state(state: Dict[str, np.ndarray]) -> bytes:
+    # Concatenate the state arrays, in a fixed order
+    return b''.join(np.ascontiguousarray(state[name], dtype=dtype).tobytes() for name, dtype in _STATE_FIELDS)
+
+
+def unpack_state(buffer: Union[bytes, np.ndarray], num_snakes: int) -> Dict[str, np.ndarray]:
+    # Read the state arrays, whose sizes only depend on the number of snakes and on the body lengths
+    buffer = np.frombuffer(buffer, dtype='uint8')
+    state, offset = {}, 0
+    for name, dtype in _STATE_FIELDS:
+        count = 2 if name == 'food' else 2 * int(state['body_lengths'].sum()) if name == 'bodies' else num_snakes
+        size = count * np.dtype(dtype).itemsize
+        state[name] = buffer[offset:offset + size].view(dtype)
+        offset += size
+    state['bodies'] = state['bodies'].reshape(-1, 2)
+    return state
+
+
+class ReplayRecorder:
+    """
+    Record games to a compact binary file.
+
+    Each game step stores, for each snake, its change of direction (0 to 3 clockwise quarter turns, int8), and the
+    food position (int16). Steps are written in chunks, each one starting with a keyframe holding the whole game
+    state, so that any step can be rebuilt by replaying at most one chunk. An index of chunks is written at the end.
+
+    Parameters
+    ----------
+    path : str
+        File to write.
+    chunk_ticks : int, optional
+        Number of game steps in each chunk. The default is 256.
+
+    """
+
+    def __init__(self, path: str, chunk_ticks: int = 256):
+        super().__init__()
+
+        # Store arguments
+        self.path = path
+        self.chunk_ticks = chunk_ticks
+
+        # Init attributes
+        self._file = None
+        self._num_snakes = 0
+        self._ticks = 0
+        self._directions = np.zeros(0, dtype='int8')
+        self._turns = np.zeros((0, 0), dtype='int8')
+        self._food = np.zeros((chunk_ticks, 2), dtype='int16')
+        self._keyframe = b''
+        self._index = []
+
+    def attach(self, environment: Environment):
+        # Start recording a game, after its setup
+        header = {
+            'game_mode': environment.game_mode,
+            'width': environment.width,
+            'height': environment.height,
+            'border': environment.border,
+            'seed': environment.seed,
+            'field_backend': environment.field_backend,
+            'num_snakes': environment.num_snakes,
+            'chunk_ticks': self.chunk_ticks,
+            'game_properties': environment.game_properties,
+        }
+        header = json.dumps(header, default=str).encode()
+        self._file = open(self.path, 'wb')
+        self._file.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        self._file.write(header)
+
+        # Init chunk buffers, and store the first keyframe
+        self._num_snakes = environment.num_snakes
+        self._turns = np.zeros((self.chunk_ticks, self._num_snakes), dtype='int8')
+        self._ticks = 0
+        self._index = []
+        self.__start_chunk(environment)
+        environment.recorder = self
+
+    def __start_chunk(self, environment: Environment):
+        # Store the state at the start of a chunk
+        state = environment.get_state()
+        self._directions = state['directions'].copy()
+        self._keyframe = pack_state(state)
+
+    def record(self, environment: Environment):
+        # Store changes of direction and food position
+        row = self._ticks % self.chunk_ticks
+        state_directions = np.array(environment.get_directions(), dtype='int8')
+        self._turns[row] = (state_directions - self._directions) % 4
+        self._directions = state_directions
+        self._food[row] = environment._food_x, environment._food_y
+        self._ticks += 1
+
+        # Write chunk when full
+        if self._ticks % self.chunk_ticks == 0:
+            self.__write_chunk(self.chunk_ticks)
+            self.__start_chunk(environment)
+
+    def __write_chunk(self, num_ticks: int):
+        # Write keyframe, changes of direction and food positions, as separate columns
+        self._index.append((self._file.tell(), len(self._keyframe), num_ticks))
+        self._file.write(self._keyframe)
+        self._file.write(self._turns[:num_ticks].tobytes())
+        self._file.write(self._food[:num_ticks].tobytes())
+
+    def close(self, environment: Environment = None):
+        # Write last chunk and index
+        if self._file is None:
+            return
+        self.__write_chunk(self._ticks % self.chunk_ticks)
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype='uint64').tobytes())
+        self._file.write(_FOOTER.pack(index_offset, len(self._index), MAGIC))
+        self._file.close()
+        self._file = None
+
+        # Stop recording
+        if environment is not None and environment.recorder is self:
+            environment.recorder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ReplayPlayer:
+    """
+    Play back a game recorded by `ReplayRecorder`.
+
+    The file is memory-mapped, and any step is rebuilt by restoring the keyframe of its chunk and replaying the
+    steps from there.
+
+    Parameters
+    ----------
+    path : str
+        File to read.
+
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+
+        # Map file and read header
+        self._data = np.memmap(path, dtype='uint8', mode='r')
+        magic, version, header_len = _PREFIX.unpack(self._data[:_PREFIX.size].tobytes())
+        assert magic == MAGIC and version == VERSION, f"Invalid replay file {path}."
+        self.header = json.loads(self._data[_PREFIX.size:_PREFIX.size + header_len].tobytes())
+        self.num_snakes = self.header['num_snakes']
+        self.chunk_ticks = self.header['chunk_ticks']
+
+        # Read chunk index
+        index_offset, num_chunks, magic = _FOOTER.unpack(self._data[-_FOOTER.size:].tobytes())
+        assert magic == MAGIC, f"Replay file {path} was not closed."
+        self._index = self._data[index_offset:index_offset + 24 * num_chunks].view('uint64').reshape(-1, 3)
+        self.num_ticks = int(self._index[:, 2].sum())
+
+        # Create the environment to play in
+        self.environment = Environment(game_mode=self.header['game_mode'], width=self.header['width'],
+                                       height=self.header['height'], border=self.header['border'],
+                                       seed=self.header['seed'],
+                                       field_backend=self.header.get('field_backend', 'dense'))
+        self.environment.setup(move_snakes=[None] * self.num_snakes, **self.header['game_properties'])
+        self._straight = {ii: 0 for ii in range(self.num_snakes)}
+        self._chunk = (-1, [], [])
+        self.tick = -1
+        self.seek(0)
+
+    def __chunk(self, chunk: int):
+        # Get keyframe, changes of direction and food positions of a chunk
+        offset, keyframe_len, num_ticks = (int(v) for v in self._index[chunk])
+        keyframe = self._data[offset:offset + keyframe_len]
+        offset += keyframe_len
+        turns = self._data[offset:offset + num_ticks * self.num_snakes].view('int8').reshape(-1, self.num_snakes)
+        offset += num_ticks * self.num_snakes
+        food = self._data[offset:offset + num_ticks * 4].view('int16').reshape(-1, 2)
+        return keyframe, turns, food
+
+    def seek(self, tick: int) -> Environment:
+        # Restore the nearest keyframe before the step, unless playing forward within its chunk
+        tick = min(max(tick, 0), self.num_ticks)
+        chunk = min(tick // self.chunk_ticks, len(self._index) - 1)
+        if not (chunk * self.chunk_ticks <= self.tick <= tick):
+            keyframe, _, _ = self.__chunk(chunk)
+            self.environment.set_state(unpack_state(keyframe, self.num_snakes))
+            self.tick = chunk * self.chunk_ticks
+
+        # Replay steps up to the required one
+        while self.tick < tick:
+            self.step()
+
+        return self.environment
+
+    def step(self) -> bool:
+        # Replay one game step, if any
+        if self.tick >= self.num_ticks:
+            return False
+        chunk, row = divmod(self.tick, self.chunk_ticks)
+        if self._chunk[0] != chunk:
+            _, turns, food = self.__chunk(chunk)
+            self._chunk = chunk, turns.tolist(), food.tolist()
+        turns, food = self._chunk[1][row], self._chunk[2][row]
+
+        # Turn snakes and move them straight, then put food where it was
+        directions = self.environment.get_directions()
+        self.environment.send_commands({ii: d + t for ii, (d, t) in enumerate(zip(directions, turns))})
+        self.environment.update(self._straight)
+        if food != [self.environment._food_x, self.environment._food_y]:
+            self.environment.set_food(*food)
+        self.tick += 1
+        return True
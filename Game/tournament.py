@@ -0,0 +1,231 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import math
+import numpy as np
+import os
+import random
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from Game.headless import run_episode
+
+
+def match_seed(seed: int, match: int) -> int:
+    # Get a reproducible seed for each match of a tournament
+    return int(np.random.SeedSequence([seed, match]).generate_state(1)[0])
+
+
+def play_match(move_snakes: Sequence[Callable], seed: int, num_games: int = 1, **kwargs) -> np.ndarray:
+    """
+    Play the games of a match without display.
+
+    Seats are rotated at each game, so that every player starts from each position. Global random generators are
+    seeded too, so that move methods relying on them give the same result in every process.
+
+    Parameters
+    ----------
+    move_snakes : Sequence[Callable]
+        Moving method of each player.
+    seed : int
+        Seed of the match.
+    num_games : int, optional
+        Number of games to play. The default is 1.
+    **kwargs
+        Further arguments passed to `run_episode`.
+
+    Returns
+    -------
+    scores : np.ndarray
+        Scores of each player (columns) in each game (rows).
+
+    """
+    # Seed global generators used by move methods
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+    # Play games rotating seats
+    num_players = len(move_snakes)
+    scores = np.zeros((num_games, num_players), dtype='int64')
+    for game in range(num_games):
+        seats = [(player + game) % num_players for player in range(num_players)]
+        result = run_episode([move_snakes[p] for p in seats], seed=match_seed(seed, game), **kwargs)
+        scores[game, seats] = result['scores']
+
+    return scores
+
+
+def _play_match(args: Tuple[Sequence[Callable], int, int, dict]) -> np.ndarray:
+    move_snakes, seed, num_games, kwargs = args
+    return play_match(move_snakes, seed, num_games, **kwargs)
+
+
+class Tournament:
+    """
+    Rank moving methods by playing them against each other.
+
+    Matches are played headless across a process pool, each with its own seed, so that results do not depend on the
+    number of workers. Moving methods must be picklable, i.e. defined at module level.
+
+    Parameters
+    ----------
+    move_methods : Dict[str, Callable]
+        Moving method of each player, by player name.
+    players_per_match : int, optional
+        Number of snakes playing each match. The default is 2.
+    games_per_match : int, optional
+        Number of games played in each match. The default is 2.
+    seed : int, optional
+        Seed of the tournament. The default is 0.
+    **kwargs
+        Further arguments passed to `run_episode`, e.g. field size, `max_steps` and game rules.
+
+    """
+
+    def __init__(self, move_methods: Dict[str, Callable], players_per_match: int = 2, games_per_match: int = 2,
+                 seed: int = 0, **kwargs):
+        super().__init__()
+
+        # Store arguments
+        assert len(move_methods) >= players_per_match, \
+            f"Not enough players. Expected at least {players_per_match}, got {len(move_methods)}."
+        self.move_methods = dict(move_methods)
+        self.players_per_match = players_per_match
+        self.games_per_match = games_per_match
+        self.seed = seed
+        self.game_kwargs = kwargs
+
+        # Init results
+        self.matches: List[Tuple[Tuple[str, ...], np.ndarray]] = []
+        self.byes: Dict[str, int] = {name: 0 for name in self.move_methods}
+
+    def round_robin(self, rounds: int = 1) -> List[Tuple[str, ...]]:
+        # Get every combination of players, for each round
+        players = list(self.move_methods.keys())
+        return [match for _ in range(rounds) for match in itertools.combinations(players, self.players_per_match)]
+
+    def swiss_round(self) -> List[Tuple[str, ...]]:
+        # Sort players by points, keeping insertion order for ties
+        points = {name: row['points'] for name, row in self.standings().items()}
+        players = sorted(self.move_methods.keys(), key=lambda name: -points[name])
+
+        # Give byes to the lowest-ranked players with the fewest byes so far
+        for _ in range(len(players) % self.players_per_match):
+            name = min(reversed(players), key=lambda other: self.byes[other])
+            players.remove(name)
+            self.byes[name] += 1
+
+        # Group players with similar points, avoiding rematches when possible
+        played = {tuple(sorted(match)) for match, _ in self.matches}
+        pairings = []
+        while len(players) >= self.players_per_match:
+            group = [players.pop(0)]
+            for name in list(players):
+                if len(group) == self.players_per_match:
+                    break
+                if all(tuple(sorted((other, name))) not in played for other in group) or \
+                        len(players) - players.index(name) <= self.players_per_match - len(group):
+                    group.append(name)
+                    players.remove(name)
+            pairings.append(tuple(group))
+
+        return pairings
+
+    def play(self, pairings: Sequence[Tuple[str, ...]], max_workers: int = None) -> List[np.ndarray]:
+        """
+        Play some matches and store their results.
+
+        Parameters
+        ----------
+        pairings : Sequence[Tuple[str, ...]]
+            Names of the players of each match.
+        max_workers : int, optional
+            Number of worker processes, None to use all cores, 0 to play in this process. The default is None.
+
+        Returns
+        -------
+        scores : List[np.ndarray]
+            Scores of each match, with shape (games, players).
+
+        """
+        # Prepare matches, each with its own seed
+        first = len(self.matches)
+        tasks = [([self.move_methods[name] for name in match], match_seed(self.seed, first + ii),
+                  self.games_per_match, self.game_kwargs) for ii, match in enumerate(pairings)]
+
+        # Play matches, serially or in parallel
+        if max_workers == 0:
+            scores = [_play_match(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                chunksize = max(1, len(tasks) // (4 * (max_workers or os.cpu_count() or 1)))
+                scores = list(executor.map(_play_match, tasks, chunksize=chunksize))
+
+        # Store results
+        self.matches.extend(zip((tuple(match) for match in pairings), scores))
+        return scores
+
+    def run(self, schedule: str = 'round_robin', rounds: int = 1, max_workers: int = None) -> Dict[str, dict]:
+        # Play all rounds
+        if schedule == 'round_robin':
+            self.play(self.round_robin(rounds), max_workers=max_workers)
+        elif schedule == 'swiss':
+            for _ in range(rounds):
+                self.play(self.swiss_round(), max_workers=max_workers)
+        else:
+            raise ValueError(f"Tournament schedule {schedule} not understood.")
+
+        return self.standings()
+
+    def standings(self, z: float = 1.96) -> Dict[str, dict]:
+        """
+        Get the results table of the tournament.
+
+        A game is won by the player with the highest score, ties are split between best players.
+
+        Parameters
+        ----------
+        z : float, optional
+            Normal quantile of confidence intervals. The default is 1.96 (95%).
+
+        Returns
+        -------
+        table : Dict[str, dict]
+            Number of games, points, win rate and mean score of each player, with their confidence intervals, and
+            number of Swiss rounds sat out, sorted by win rate.
+
+        """
+        # Collect points and scores of each player
+        points = {name: [] for name in self.move_methods}
+        scores = {name: [] for name in self.move_methods}
+        for match, match_scores in self.matches:
+            best = match_scores == match_scores.max(axis=1, keepdims=True)
+            shares = best / best.sum(axis=1, keepdims=True)
+            for ii, name in enumerate(match):
+                points[name].extend(shares[:, ii])
+                scores[name].extend(match_scores[:, ii])
+
+        # Compute statistics
+        table = {}
+        for name in self.move_methods:
+            n = len(points[name])
+            win_rate = float(np.mean(points[name])) if n else 0.
+            mean_score = float(np.mean(scores[name])) if n else 0.
+            score_err = z * float(np.std(scores[name], ddof=1)) / math.sqrt(n) if n > 1 else math.inf
+
+            # Wilson interval for the win rate
+            if n:
+                center = (win_rate + z**2 / (2 * n)) / (1 + z**2 / n)
+                err = z * math.sqrt(win_rate * (1 - win_rate) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+            else:
+                center, err = 0.5, 0.5
+
+            table[name] = {
+                'games': n,
+                'points': float(np.sum(points[name])),
+                'win_rate': win_rate,
+                'win_rate_ci': (max(center - err, 0.), min(center + err, 1.)),
+                'mean_score': mean_score,
+                'mean_score_ci': (mean_score - score_err, mean_score + score_err),
+                'byes': self.byes[name],
+            }
+
+        return dict(sorted(table.items(), key=lambda item: -item[1]['win_rate']))
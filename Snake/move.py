@@ -1,6 +1,8 @@
 import numpy as np
 import random
 
+from Snake.policy import batched, with_analysis, with_rng
+
 
 # ----- Functions skeleton -----
 def move_method_field(food, body, field) -> int:
@@ -16,13 +18,15 @@ def move_method_body(food, body, head_field, body_field) -> int:
 # ------------------------------
 
 
-def move_method_field_random(food, body, field) -> int:
-    return random.randint(-1, 1)
+@with_rng
+def move_method_field_random(food, body, field, rng=None) -> int:
+    return int(rng.integers(-1, 2)) if rng is not None else random.randint(-1, 1)
 
 
-def move_method_field_fuzzy(food, body, field) -> int:
+@with_rng
+def move_method_field_fuzzy(food, body, field, rng=None) -> int:
     turn_prob = 0.05
-    return ((x := random.random()) < turn_prob) + (x < (1-turn_prob)) - 1
+    return ((x := rng.random() if rng is not None else random.random()) < turn_prob) + (x < (1-turn_prob)) - 1
 
 
 def move_method_field_food_based(food, body, field) -> int:
@@ -39,3 +43,34 @@ def move_method_field_food_body_aware(food, body, field) -> int:
         move = other_moves.pop()
 
     return move
+
+
+@with_analysis
+def move_method_field_flood_fill(food, body, field, analysis=None) -> int:
+    # Prefer the largest reachable region, then cells enemies cannot reach first, then the shortest way to food
+    region = analysis.moves(analysis.region_size)
+    food_distance = analysis.moves(analysis.food_distance)
+    enemy_distance = analysis.moves(analysis.enemy_head_distance)
+    safe = (enemy_distance < 0) | (enemy_distance > 1)
+    food_distance = np.where(food_distance < 0, field.size, food_distance)
+    return int(np.lexsort((food_distance, ~safe, -region))[0]) - 1
+
+
+@batched
+def move_method_field_food_based_batched(food, body, field) -> np.ndarray:
+    return np.sign(food[:, 0])
+
+
+@batched
+def move_method_field_food_body_aware_batched(food, body, field) -> np.ndarray:
+    # Get blocked moves (turn left, go straight, turn right) for each snake
+    steps = np.array([[-1, 0], [0, 1], [1, 0]])
+    blocked = (body[:, :, None, :] == steps).all(-1).any(1)
+
+    # Try moving towards food first, then the other moves in a fixed order
+    move = np.sign(food[:, 0]).astype('int64')
+    candidates = np.array([[-1, 0, 1], [0, 1, -1], [1, 0, -1]])[move + 1]
+    free = ~np.take_along_axis(blocked, candidates + 1, axis=1)
+    free[:, -1] = True
+
+    return candidates[np.arange(len(move)), np.argmax(free, axis=1)]
@@ -0,0 +1,292 @@
+from collections import OrderedDict
+import functools
+import numpy as np
+from typing import Callable, Dict, Hashable, Tuple, Union
+
+
+def batched(method: Callable) -> Callable:
+    """
+    Flag a moving method as batched.
+
+    A batched moving method is called once per tick with the observations of all the living snakes it controls, in
+    one or many environments. It receives the same arguments as a plain moving method, stacked along a new first
+    axis, and returns an array with one move (-1 turn left, 0 go straight, 1 turn right) per snake.
+
+    Bodies have different lengths, so they are padded at the tail end by repeating the tail block: the head is
+    always the last block, and checks like "is this cell part of the body" are not affected by the padding. The
+    same holds for the views of body blocks in 'body' game mode.
+
+    Parameters
+    ----------
+    method : Callable
+        Moving method to flag.
+
+    Returns
+    -------
+    method : Callable
+        The same moving method.
+
+    """
+    method.batched = True
+    return method
+
+
+def is_batched(method: Callable) -> bool:
+    return getattr(method, 'batched', False)
+
+
+def with_analysis(method: Callable) -> Callable:
+    """
+    Flag a moving method as using the shared field analysis.
+
+    Such a method also receives an `analysis` keyword argument: a `SnakeAnalysis` with distance to food, size of
+    reachable regions and distance to the nearest enemy head, computed once for each state of the field and shared
+    by all snakes. Batched methods receive a list with one `SnakeAnalysis` per snake.
+
+    Parameters
+    ----------
+    method : Callable
+        Moving method to flag.
+
+    Returns
+    -------
+    method : Callable
+        The same moving method.
+
+    """
+    method.analysis = True
+    return method
+
+
+def uses_analysis(method: Callable) -> bool:
+    return getattr(method, 'analysis', False)
+
+
+def with_rng(method: Callable) -> Callable:
+    """
+    Flag a moving method as random.
+
+    Such a method also receives a `rng` keyword argument: the `numpy.random.Generator` stream of its snake, seeded by
+    the environment, so that games stay reproducible. Batched methods receive a list with one stream per snake.
+
+    Parameters
+    ----------
+    method : Callable
+        Moving method to flag.
+
+    Returns
+    -------
+    method : Callable
+        The same moving method.
+
+    """
+    method.rng = True
+    return method
+
+
+def uses_rng(method: Callable) -> bool:
+    return getattr(method, 'rng', False)
+
+
+class ObservationBuffer:
+    """
+    Preallocated arrays holding stacked observations.
+
+    Arrays are reused between ticks and only reallocated when a larger one is needed, growing by at least a factor
+    of two. Returned arrays are always contiguous.
+
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        # Init buffers by name
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype='int32') -> np.ndarray:
+        # Get a contiguous array with the required shape, reallocating the buffer if needed
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name, None)
+        if buffer is None or buffer.size < size or buffer.dtype != np.dtype(dtype):
+            buffer = np.zeros(max(size, 2 * (buffer.size if buffer is not None else 0)), dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+    def stack(self, observations, names: Tuple[str, ...] = ('food', 'body', 'field', 'body_field')) -> tuple:
+        """
+        Stack observations of many snakes.
+
+        Parameters
+        ----------
+        observations : Sequence[tuple]
+            Arguments of a moving method for each snake, i.e. food, body and fields.
+        names : Tuple[str, ...], optional
+            Names of the buffers to use for each argument.
+
+        Returns
+        -------
+        stacked : tuple
+            Arguments of a batched moving method.
+
+        """
+        num = len(observations)
+        stacked = []
+        for arg, name in enumerate(names[:len(observations[0])]):
+            values = [obs[arg] for obs in observations]
+            if name in ('body', 'body_field'):
+                # Pad bodies repeating the tail
+                length = max(len(value) for value in values)
+                out = self.get(name, (num, length) + np.shape(values[0])[1:], np.asarray(values[0]).dtype)
+                for ii, value in enumerate(values):
+                    out[ii, length - len(value):] = value
+                    out[ii, :length - len(value)] = value[0]
+            else:
+                out = self.get(name, (num,) + np.shape(values[0]), np.asarray(values[0]).dtype)
+                for ii, value in enumerate(values):
+                    out[ii] = value
+            stacked.append(out)
+
+        return tuple(stacked)
+
+
+class MoveCache:
+    """
+    Bounded cache of moves, dropping the least recently used ones when full.
+
+    Pass the same cache to many memoized moving methods to share it across snakes and environments: keys include
+    the moving method, so different methods never share moves.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of moves kept. The default is 65536.
+
+    """
+
+    def __init__(self, maxsize: int = 65536):
+        super().__init__()
+
+        # Store arguments
+        self.maxsize = maxsize
+
+        # Init moves and statistics
+        self._moves: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._moves)
+
+    @property
+    def stats(self) -> Dict[str, Union[int, float]]:
+        # Get number of hits, misses and stored moves, and hit rate
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._moves),
+                'hit_rate': self.hits / calls if calls else 0.}
+
+    def get(self, key: Hashable) -> Union[int, None]:
+        # Get a stored move, or None if missing
+        move = self._moves.get(key, None)
+        if move is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._moves.move_to_end(key)
+        return move
+
+    def put(self, key: Hashable, move: int):
+        # Store a move, dropping the least recently used one if full
+        self._moves[key] = move
+        if len(self._moves) > self.maxsize:
+            self._moves.popitem(last=False)
+
+    def clear(self):
+        # Drop all moves and statistics
+        self._moves.clear()
+        self.hits = self.misses = 0
+
+
+class MemoizedMove:
+    """
+    Moving method whose moves are cached, keyed by the part of the observation it depends on.
+
+    Only use it for deterministic methods of the declared inputs: the method is called only when the encoding of
+    its inputs is not in the cache. Create it with `memoized`.
+
+    """
+
+    def __init__(self, method: Callable, food: Union[str, None] = 'exact', body: Union[int, None] = None,
+                 fields: bool = False, cache: MoveCache = None):
+        super().__init__()
+
+        # Store arguments
+        assert not is_batched(method), "Batched moving methods can not be memoized."
+        assert not uses_analysis(method), "Moving methods using the field analysis can not be memoized."
+        assert not uses_rng(method), "Random moving methods can not be memoized."
+        assert food in ('exact', 'sign', None), f"Food encoding {food} not understood."
+        functools.update_wrapper(self, method)
+        self.method = method
+        self.food = food
+        self.body = body
+        self.fields = fields
+        self.cache = cache if cache is not None else MoveCache()
+
+        # Init index of each cell around the head
+        self._cell_index = np.array([1, 2 * body + 1]) if body is not None else None
+
+    def key(self, food, body, *fields) -> tuple:
+        # Encode food position, cells of body blocks near the head and fields, as declared
+        key = [id(self.method)]
+        if self.food == 'exact':
+            key.append(np.asarray(food).tobytes())
+        elif self.food == 'sign':
+            key.append(np.sign(food).tobytes())
+        if self.body is not None:
+            near = body[np.abs(body).max(-1) <= self.body]
+            key.append(frozenset((near @ self._cell_index).tolist()))
+        if self.fields:
+            key.extend(np.ascontiguousarray(field).tobytes() for field in fields)
+        return tuple(key)
+
+    def __call__(self, food, body, *fields) -> int:
+        # Look the move up, calling the method only if missing
+        key = self.key(food, body, *fields)
+        move = self.cache.get(key)
+        if move is None:
+            move = int(self.method(food, body, *fields))
+            self.cache.put(key, move)
+        return move
+
+
+def memoized(method: Callable, food: Union[str, None] = 'exact', body: Union[int, None] = None,
+             fields: bool = False, cache: MoveCache = None) -> MemoizedMove:
+    """
+    Cache the moves of a deterministic moving method, keyed by the part of the observation it depends on.
+
+    The result can be passed to `Snake.set_move_method` or `Environment.setup` as any moving method. Policies that
+    only look at the surroundings of the head see the same few situations again and again, and are then called only
+    once for each of them. Building the key costs a few microseconds, so only memoize methods slower than that.
+
+    Parameters
+    ----------
+    method : Callable
+        Moving method, a deterministic function of the declared inputs.
+    food : str, optional
+        Encoding of the relative food position: 'exact', 'sign' (only the direction along each axis) or None if not
+        used. The default is 'exact'.
+    body : int, optional
+        Distance from the head of the body blocks the method looks at, None if the body is not used. The default is
+        None.
+    fields : bool, optional
+        If True the fields are part of the key, e.g. the small windows of 'head' and 'body' game modes. The default
+        is False.
+    cache : MoveCache, optional
+        Cache to use, e.g. shared with other methods. The default is a new cache.
+
+    Returns
+    -------
+    method : MemoizedMove
+        Memoized moving method, with the cache as `cache` attribute.
+
+    """
+    return MemoizedMove(method, food=food, body=body, fields=fields, cache=cache)
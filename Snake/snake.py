@@ -1,23 +1,93 @@
-from random import sample
-from typing import List, Callable
+import numpy as np
+from typing import List, Callable, Union
 
 import game_rules
+from game_rules.streams import copy_generator, pack_generator_state, unpack_generator_state
+from game_rules.transforms import DIRECTIONS, DIRECTION_INDEX
+
+
+def move_straight(*args, **kwargs) -> int:
+    # Moving method of snakes with no moving method
+    return 0
 
 
 class Snake:
-    def __init__(self, pos: List[tuple] = ((0, 0),), length: int = None, direction: str = None):
+    """
+    A snake, with its body, direction, score and moving methods.
+
+    The body is stored in a preallocated int16 ring buffer, where each block is written twice (at its ring position
+    and one capacity further). Any run of consecutive blocks is thus contiguous in memory, and `body` is a zero-copy
+    view from tail to head. The buffer doubles its capacity when the snake outgrows it.
+
+    """
+
+    __slots__ = ('len', 'head', 'alive', 'direction_index', 'score', '_buffer', '_capacity', '_start', '_count',
+                 '_move_methods', '_seed', '_rng')
+
+    def __init__(self, pos: List[tuple] = ((0, 0),), length: int = None, direction: str = None, capacity: int = None,
+                 seed: int = None):
         super().__init__()
 
         # Store attributes
         self.len = length if length is not None else len(pos)
-        self.body = [tuple(p) for p in pos]
         self.head = tuple(pos[0])
         self.alive = True
-        self.direction = direction if direction is not None else sample('nswe', 1)[0]
+        self._seed = seed
+        self._rng: Union[np.random.Generator, None] = None
+        self.direction = direction if direction is not None else DIRECTIONS[self.rng.integers(4)]
+
+        # Allocate body buffer
+        self._capacity = max(capacity or 2 * self.len, len(pos), 1)
+        self._buffer = np.zeros((2 * self._capacity, 2), dtype='int16')
+        self._start = 0
+        self._count = len(pos)
+        self._buffer[:self._count] = pos
+        self._buffer[self._capacity:self._capacity + self._count] = pos
 
         # Initialize score
         self.score = 0
 
+        # Initialize moving methods
+        self._move_methods = {
+            game_rules.GameModes.field: self.move_method_field,
+            game_rules.GameModes.head: self.move_method_head,
+            game_rules.GameModes.body: self.move_method_body,
+        }
+
+    @property
+    def body(self) -> np.ndarray:
+        # Get a read-only view of the body from tail to head, valid until next update
+        body = self._buffer[self._start:self._start + self._count]
+        body.flags.writeable = False
+        return body
+
+    @property
+    def rng(self) -> np.random.Generator:
+        # Get the random stream of the snake, created on first use
+        if self._rng is None:
+            self._rng = np.random.default_rng(self._seed)
+        return self._rng
+
+    def get_rng_state(self) -> List[int]:
+        # Get seed, flags (1 if seeded, 2 if the stream was used) and stream state, as eight 64 bit words
+        state = pack_generator_state(self._rng.bit_generator.state) if self._rng is not None else [0] * 6
+        return [self._seed or 0, (self._seed is not None) | (self._rng is not None) << 1] + state
+
+    def set_rng_state(self, words: List[int]):
+        # Restore seed and stream state, as given by `get_rng_state`
+        self._seed = int(words[0]) if words[1] & 1 else None
+        self._rng = None
+        if words[1] & 2:
+            self.rng.bit_generator.state = unpack_generator_state(words[2:8])
+
+    @property
+    def direction(self) -> str:
+        return DIRECTIONS[self.direction_index]
+
+    @direction.setter
+    def direction(self, direction: str):
+        self.direction_index = DIRECTION_INDEX[direction]
+
     @property
     def x(self):
         return self.head[0]
@@ -26,12 +96,55 @@ class Snake:
     def y(self):
         return self.head[1]
 
-    def update(self, new_head):
+    def __grow(self):
+        # Double the buffer capacity, moving the body at its start
+        body = self.body.copy()
+        self._capacity *= 2
+        self._buffer = np.zeros((2 * self._capacity, 2), dtype='int16')
+        self._buffer[:self._count] = body
+        self._buffer[self._capacity:self._capacity + self._count] = body
+        self._start = 0
+
+    def copy(self) -> 'Snake':
+        # Get an independent copy of the snake, sharing its moving methods
+        snake = Snake.__new__(Snake)
+        snake.len, snake.head, snake.alive, snake.score = self.len, self.head, self.alive, self.score
+        snake.direction_index = self.direction_index
+        snake._buffer, snake._capacity = self._buffer.copy(), self._capacity
+        snake._start, snake._count = self._start, self._count
+        snake._move_methods = dict(self._move_methods)
+        snake._seed, snake._rng = self._seed, copy_generator(self._rng) if self._rng is not None else None
+        return snake
+
+    def set_body(self, body: np.ndarray):
+        # Replace the whole body, from tail to head
+        body = np.asarray(body, dtype='int16').reshape(-1, 2)
+        if len(body) > self._capacity:
+            self._capacity = 2 * len(body)
+            self._buffer = np.zeros((2 * self._capacity, 2), dtype='int16')
+        self._buffer[:len(body)] = body
+        self._buffer[self._capacity:self._capacity + len(body)] = body
+        self._start = 0
+        self._count = len(body)
+        self.head = tuple(int(p) for p in body[-1])
+
+    def update(self, new_head) -> Union[tuple, None]:
+        # Drop tail, if needed
+        tail = None
+        if self._count + 1 > self.len:
+            tail = tuple(int(p) for p in self._buffer[self._start])
+            self._start = (self._start + 1) % self._capacity
+            self._count -= 1
+
         # Update head and body
+        if self._count == self._capacity:
+            self.__grow()
         self.head = tuple(new_head)
-        self.body.append(self.head)
-        if len(self.body) > self.len:
-            del self.body[0]
+        end = (self._start + self._count) % self._capacity
+        self._buffer[end] = self._buffer[end + self._capacity] = self.head
+        self._count += 1
+
+        return tail
 
     def check_collision(self, field, pos: tuple = None):
         # Check if snake collided in field
@@ -44,14 +157,10 @@ class Snake:
 
     def __move(self, mode=game_rules.GameModes.field, /, *args, **kwargs) -> int:
         # Choose the moving method
-        if mode == game_rules.GameModes.field:
-            return self.move_method_field(*args, **kwargs)
-        elif mode == game_rules.GameModes.head:
-            return self.move_method_head(*args, **kwargs)
-        elif mode == game_rules.GameModes.body:
-            return self.move_method_body(*args, **kwargs)
-        else:
+        method = self._move_methods.get(mode, None)
+        if method is None:
             return 0
+        return method(*args, **kwargs)
 
     @ staticmethod
     def move_method_field(food, body, field) -> int:
@@ -65,13 +174,12 @@ class Snake:
     def move_method_body(food, body, head_field, body_field) -> int:
         raise NotImplemented('Move method not implemented.')
 
+    def get_move_method(self, mode: str = 'field', /) -> Union[Callable, None]:
+        return self._move_methods.get(mode, None)
+
     def set_move_method(self, mode: str = 'field', method: Callable = None, /):
         # Set the correct moving method
         if method is None:
-            method = lambda *args, **kwargs: 0
-        if mode == game_rules.GameModes.field:
-            self.move_method_field = method
-        elif mode == game_rules.GameModes.head:
-            self.move_method_head = method
-        elif mode == game_rules.GameModes.body:
-            self.move_method_body = method
+            method = move_straight
+        if mode in self._move_methods:
+            self._move_methods[mode] = method
@@ -0,0 +1,62 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Code run by a fresh interpreter: import the simulation core and play one step, without display
+CORE = """
+import sys
+import game_rules
+from Game.environment import Environment
+from Snake import move
+env = Environment(game_mode=game_rules.GameModes.field, width=20, height=20, seed=0)
+env.setup(move_snakes=[move.move_method_field_food_body_aware] * 2)
+env.update()
+print('pygame' in sys.modules)
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cold_start(repeat: int = 5) -> tuple:
+    """
+    Measure the time to start a new interpreter, import the simulation core and play one step.
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Number of interpreters to start, the fastest one is kept. The default is 5.
+
+    Returns
+    -------
+    seconds : float
+        Fastest cold start.
+    pygame : bool
+        True if pygame was imported.
+
+    """
+    times, pygame = [], False
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CORE], cwd=ROOT, check=True, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        pygame |= output.stdout.strip().endswith('True')
+    return min(times), pygame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold start of the simulation core.")
+    parser.add_argument('--budget', type=float, default=0.5, help="maximum cold start, in seconds")
+    parser.add_argument('--repeat', type=int, default=5, help="number of interpreters to start")
+    args = parser.parse_args()
+
+    # Fail if pygame is imported or the budget is exceeded
+    seconds, pygame = cold_start(args.repeat)
+    print(f"cold start: {seconds * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms), pygame imported: {pygame}")
+    if pygame or seconds > args.budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from typing import Dict, List, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Game.environment import Environment  # noqa: E402
+from Snake.snake import Snake  # noqa: E402
+
+# Base configuration, and values swept for each parameter
+BASE = {'size': 50, 'snakes': 4, 'length': 3, 'game_mode': 'field', 'border': False}
+SWEEP = {
+    'size': (20, 50, 100, 200),
+    'snakes': (2, 4, 16, 64),
+    'length': (3, 20, 100),
+    'game_mode': ('field', 'head', 'body'),
+    'border': (False, True),
+}
+
+# Latency percentiles reported for each phase
+PERCENTILES = (50, 90, 99)
+
+
+def food_seeker(food, body, *fields) -> int:
+    # Turn towards food, in any game mode
+    return int(np.sign(food[0]))
+
+
+def configs(grid: bool = False) -> List[Dict]:
+    # Get all combinations of swept values, or sweep one parameter at a time around the base configuration
+    if grid:
+        return [dict(zip(SWEEP, values)) for values in itertools.product(*SWEEP.values())]
+    sweep = [BASE]
+    for name, values in SWEEP.items():
+        sweep.extend(dict(BASE, **{name: value}) for value in values if value != BASE[name])
+    return sweep
+
+
+def config_name(config: Dict) -> str:
+    return ','.join(f'{name}={value}' for name, value in config.items())
+
+
+def latency(times: Sequence[int]) -> Dict[str, float]:
+    # Get mean and percentiles of latencies in nanoseconds, as microseconds
+    times = np.asarray(times, dtype='float64') / 1000
+    stats = {f'p{p}': float(np.percentile(times, p)) for p in PERCENTILES}
+    stats['mean'] = float(times.mean())
+    return stats
+
+
+def new_environment(config: Dict, seed: int) -> Environment:
+    # Create an environment and start a game, seeding global generators too
+    random.seed(seed)
+    np.random.seed(seed)
+    env = Environment(game_mode=config['game_mode'], width=config['size'], height=config['size'],
+                      border=config['border'], seed=seed)
+    env.setup(move_snakes=[food_seeker] * config['snakes'], len_snakes=config['length'])
+    return env
+
+
+def play(env: Environment, config: Dict, steps: int, times: List[int] = None, renderer=None):
+    # Play some steps, starting a new game when over, and store the latency of each update
+    for _ in range(steps):
+        if env.game_over():
+            env.setup(move_snakes=[food_seeker] * config['snakes'], len_snakes=config['length'])
+        start = time.perf_counter_ns()
+        env.update()
+        if times is not None:
+            times.append(time.perf_counter_ns() - start)
+        if renderer is not None:
+            start = time.perf_counter_ns()
+            renderer[0].draw(env.game_field)
+            renderer[1].append(time.perf_counter_ns() - start)
+
+
+def micro(function, repeat: int) -> List[int]:
+    # Get the latency of each call of a function
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        times.append(time.perf_counter_ns() - start)
+    return times
+
+
+def new_renderer(config: Dict, block_size: int = 4):
+    # Create a renderer on a hidden display, importing pygame only when needed
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from Game.renderer import FieldRenderer
+    pygame.init()
+    display = pygame.display.set_mode((config['size'] * block_size, config['size'] * block_size))
+    colormap = {1: (255, 255, 255), -1: (213, 50, 80)}
+    colormap.update({num + 2: (50 + num % 200, 100, 200) for num in range(config['snakes'])})
+    return FieldRenderer(display, block_size, colormap)
+
+
+def run_config(config: Dict, steps: int, seed: int, render: bool = False) -> Dict:
+    """
+    Benchmark one configuration.
+
+    Parameters
+    ----------
+    config : Dict
+        Board size, number and length of snakes, game mode and border of the games.
+    steps : int
+        Number of game steps to time.
+    seed : int
+        Seed of the games.
+    render : bool, optional
+        If True time drawing each step too. The default is False.
+
+    Returns
+    -------
+    result : Dict
+        Steps per second, latency of each phase in microseconds and peak memory in bytes.
+
+    """
+    # Time game steps, after a few warm-up steps
+    env = new_environment(config, seed)
+    play(env, config, min(steps, 50))
+    env = new_environment(config, seed)
+    times, render_times = [], []
+    renderer = (new_renderer(config), render_times) if render else None
+    play(env, config, steps, times, renderer)
+
+    # Time single phases
+    snake = Snake(pos=[(0, 0)], length=config['length'], direction='e', capacity=config['length'])
+    heads = iter(itertools.cycle([(x % config['size'], 0) for x in range(1, config['size'] + 1)]))
+    phases = {
+        'update': latency(times),
+        'game_field': latency(micro(lambda: env.game_field, 1000)),
+        'put_food': latency(micro(env._Environment__put_food, 1000)),
+        'snake_update': latency(micro(lambda: snake.update(next(heads)), 1000)),
+    }
+    if render:
+        phases['render'] = latency(render_times)
+
+    # Measure peak memory of a game, apart from timing
+    tracemalloc.start()
+    play(new_environment(config, seed), config, min(steps, 200))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'name': config_name(config),
+        'config': config,
+        'steps_per_sec': steps / (sum(times) / 1e9),
+        'phases': phases,
+        'peak_memory': peak,
+    }
+
+
+def run(steps: int = 1000, seed: int = 0, grid: bool = False, render: bool = False) -> Dict:
+    # Benchmark all configurations
+    results = []
+    for config in configs(grid):
+        results.append(run_config(config, steps, seed, render))
+        print(f"{results[-1]['name']:<70} {results[-1]['steps_per_sec']:>10.0f} steps/s "
+              f"p99 {results[-1]['phases']['update']['p99']:>8.1f} us", file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'steps': steps,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.1) -> List[str]:
+    """
+    Find regressions against a baseline.
+
+    A configuration regressed if its steps per second dropped, or the median latency of a phase grew, by more than
+    the threshold. Configurations missing from either results are skipped.
+
+    Parameters
+    ----------
+    results : Dict
+        Benchmark results.
+    baseline : Dict
+        Baseline results.
+    threshold : float, optional
+        Relative change allowed. The default is 0.1.
+
+    Returns
+    -------
+    regressions : List[str]
+        Description of each regression.
+
+    """
+    regressions = []
+    baseline = {result['name']: result for result in baseline['results']}
+    for result in results['results']:
+        base = baseline.get(result['name'], None)
+        if base is None:
+            continue
+        if result['steps_per_sec'] < base['steps_per_sec'] * (1 - threshold):
+            regressions.append(f"{result['name']}: steps/s {base['steps_per_sec']:.0f} -> "
+                               f"{result['steps_per_sec']:.0f}")
+        for phase, stats in result['phases'].items():
+            if phase in base['phases'] and stats['p50'] > base['phases'][phase]['p50'] * (1 + threshold):
+                regressions.append(f"{result['name']}: {phase} p50 {base['phases'][phase]['p50']:.2f} us -> "
+                                   f"{stats['p50']:.2f} us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths.")
+    parser.add_argument('-o', '--output', help="file where to write results as JSON")
+    parser.add_argument('--results', help="read results from this file instead of running the benchmarks")
+    parser.add_argument('--compare', help="baseline results to compare with, exit with 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change allowed when comparing")
+    parser.add_argument('--steps', type=int, default=1000, help="game steps timed for each configuration")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the games")
+    parser.add_argument('--grid', action='store_true', help="run all combinations of swept values")
+    parser.add_argument('--render', action='store_true', help="time drawing each step on a hidden display")
+    args = parser.parse_args()
+
+    # Run benchmarks, or read stored results
+    if args.results:
+        with open(args.results) as file:
+            results = json.load(file)
+    else:
+        results = run(args.steps, args.seed, args.grid, args.render)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    # Compare with baseline
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == '__main__':
+    main()
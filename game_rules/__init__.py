@@ -10,3 +10,13 @@ class GameModes(str, enum.Enum):
 class KillModes(str, enum.Enum):
     die = 'die'
     cut = 'cut'
+
+
+class StepModes(str, enum.Enum):
+    sequential = 'sequential'
+    simultaneous = 'simultaneous'
+
+
+class FieldBackends(str, enum.Enum):
+    dense = 'dense'
+    chunked = 'chunked'
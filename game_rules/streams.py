@@ -0,0 +1,25 @@
+import numpy as np
+from typing import List, Sequence
+
+# Mask of the lower 64 bits of the 128 bit PCG64 state
+_MASK64 = (1 << 64) - 1
+
+
+def pack_generator_state(state: dict) -> List[int]:
+    # Get the state of a PCG64 generator as six 64 bit words
+    return [state['state']['state'] >> 64, state['state']['state'] & _MASK64, state['state']['inc'] >> 64,
+            state['state']['inc'] & _MASK64, state['has_uint32'], state['uinteger']]
+
+
+def unpack_generator_state(words: Sequence[int]) -> dict:
+    # Get the state of a PCG64 generator from six 64 bit words
+    words = [int(word) for word in words]
+    return {'bit_generator': 'PCG64', 'state': {'state': words[0] << 64 | words[1], 'inc': words[2] << 64 | words[3]},
+            'has_uint32': words[4], 'uinteger': words[5]}
+
+
+def copy_generator(generator: np.random.Generator) -> np.random.Generator:
+    # Get an independent copy of a PCG64 generator, faster than deepcopy
+    bit_generator = np.random.PCG64(0)
+    bit_generator.state = generator.bit_generator.state
+    return np.random.Generator(bit_generator)
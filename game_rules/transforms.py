@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Union
+
+# Directions, in clockwise order
+DIRECTIONS: str = 'nesw'
+DIRECTION_INDEX: dict = {d: i for i, d in enumerate(DIRECTIONS)}
+
+# Field steps (x, y) when moving towards each direction
+STEPS = np.array([[0, -1], [1, 0], [0, 1], [-1, 0]], dtype='int32')
+
+# New direction after each move (-1 turn left, 0 go straight, 1 turn right), as TURNS[direction, move + 1]
+TURNS = (np.arange(4)[:, None] + np.array([-1, 0, 1])) % 4
+
+# Rotation matrices of k * 90 degrees for row vectors (vect.dot(ROTATIONS[k]))
+ROTATIONS = np.array([
+    [[1, 0], [0, 1]],
+    [[0, -1], [1, 0]],
+    [[-1, 0], [0, -1]],
+    [[0, 1], [-1, 0]],
+], dtype='int32')
+
+# Rotations needed to bring each direction facing up ('nwse' order)
+EGO_ROTATIONS = np.array(['nwse'.index(d) for d in DIRECTIONS])
+
+# Transforms from field offsets (y pointing down) to egocentric coordinates (facing up, y pointing up)
+EGOCENTRIC = np.diag([1, -1]).astype('int32') @ ROTATIONS[EGO_ROTATIONS]
+
+
+def egocentric(points: np.ndarray, head: Union[np.ndarray, tuple], direction: Union[np.ndarray, int]) -> np.ndarray:
+    """
+    Get coordinates of field points as seen by snakes.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        Field positions (x, y), with shape (..., 2) for one snake or (snakes, ..., 2) for many.
+    head : np.ndarray or tuple
+        Head position (x, y) of each snake.
+    direction : np.ndarray or int
+        Direction of each snake, as index in DIRECTIONS.
+
+    Returns
+    -------
+    points : np.ndarray
+        Egocentric positions, where the snake head is in (0, 0) facing (0, 1).
+
+    """
+    points, head, direction = np.asarray(points), np.asarray(head, dtype='int32'), np.asarray(direction)
+    if direction.ndim == 0:
+        return (points - head) @ EGOCENTRIC[direction]
+
+    # Transform each snake's points with its own matrix
+    offsets = points.reshape(direction.size, -1, 2) - head.reshape(direction.size, 1, 2)
+    return np.matmul(offsets, EGOCENTRIC[direction]).reshape(points.shape)
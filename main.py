@@ -1,7 +1,5 @@
-import pygame
 from typing import Union
 
-from Game.game import Game
 import game_rules
 
 # ----- Get the moving methods -----
@@ -13,6 +11,7 @@ move_snakes = (None, None)
 # Set game rules
 game_mode: str = game_rules.GameModes.field  # game mode
 kill_mode: str = game_rules.KillModes.die  # kill mode
+step_mode: str = game_rules.StepModes.sequential  # move snakes one after the other, or all at once (simultaneous)
 food_score: int = 1  # points to eat food
 kill_score: int = 5  # points to kill another snake
 recognize_enemies: bool = False  # if True, each snake is able to recognize each other snake individually
@@ -45,7 +44,10 @@ game_width: int = 50
 game_height: int = 50
 show_live_scores: bool = False
 block_size: int = 10
-snake_speed: float = 15  # how many movements per second, can be < 1
+snake_speed: float = 15  # how many movements per second, can be < 1, or float('inf') to move as fast as possible
+render_fps: float = 60  # how many times per second the field is drawn, skipping movements in between
+policy_deadline: Union[float, None] = None  # if set, call moving methods concurrently, going straight when late (s)
+record: Union[str, None] = None  # if set, record each game to this file, e.g. 'game_{}.replay' numbers the games
 
 # MANUAL / HYBRID MODE
 # -------------------------
@@ -67,16 +69,22 @@ snake_speed: float = 15  # how many movements per second, can be < 1
 
 
 def main():
+    # Import display modules only when playing
+    import pygame
+    from Game.game import Game
+
     # Create the display
     pygame.init()
     display = pygame.display.set_mode((game_width * block_size + show_live_scores * 100, game_height * block_size))
     pygame.display.set_caption('AI Snake - let the best win')
 
     # Create and start the game
-    Game(display, size=(game_width, game_height), game_mode=game_mode, border=border, snake_speed=snake_speed,
-         block_size=block_size).play(move_snakes=move_snakes, len_snakes=snake_initial_len, food_score=food_score,
-                                     kill_score=kill_score, recognize_enemies=recognize_enemies,
-                                     keep_corpse=keep_corpse)
+    game = Game(display, size=(game_width, game_height), game_mode=game_mode, border=border,
+                snake_speed=snake_speed, block_size=block_size, render_fps=render_fps)
+    game.play(move_snakes=move_snakes, len_snakes=snake_initial_len, food_score=food_score, kill_score=kill_score,
+              recognize_enemies=recognize_enemies, keep_corpse=keep_corpse, fov_head=fov_head,
+              fov_head_offset=fov_head_offset, fov_body=fov_body, step_mode=step_mode, record=record,
+              policy_deadline=policy_deadline)
 
 
 if __name__ == '__main__':